@@ -1,100 +1,363 @@
+import os
 import dash
-from dash import dcc, html, Input, Output
-from data_processing import get_cleaned_data
-from dashboard_layouts import create_figures
-
-# 1. Initialize data
-data = get_cleaned_data()
-
-app = dash.Dash(__name__)
-
-app.layout = html.Div([
-    # Header
-    html.Div([
-        html.H1("📊 Adult Census Income",
-                style={
-                    'textAlign': 'center',
-                    'color': 'white',
-                    'padding': '30px',
-                    'background': 'linear-gradient(135deg, #667eea 0%, #764ba2 100%)',
-                    'margin': '0',
-                    'boxShadow': '0 4px 6px rgba(0,0,0,0.1)'
-                }),
-    ]),
-
-    # 2. Age Range Filter Section
-    html.Div([
-        html.Label("🔍 Filter by Age Group:", style={'fontWeight': 'bold', 'marginBottom': '10px', 'display': 'block'}),
-        dcc.Dropdown(
-            id='age-filter',
-            options=[{'label': age, 'value': age} for age in sorted(data['age_range'].unique())],
-            value=list(data['age_range'].unique()), 
-            multi=True,
-            placeholder="Select age groups...",
-            style={'width': '100%'}
+from flask import jsonify
+from dash import dcc, html, no_update, ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
+from data_processing import AGE_LABELS, CATEGORY_ORDERS
+from bitmap_index import FILTER_COLUMNS, filter_key
+from dashboard_layouts import TAB_FIGURES
+from dataset_store import DatasetStore
+from figure_cache import FigureCache, age_selections
+from insights import INSIGHTS_TAB, InsightRunner, insight_figures
+import metrics
+import payload
+from metrics import span, profiled
+
+
+def create_app(store=None, lazy=None):
+    # Build the Dash app around a DatasetStore. Each gunicorn worker calls
+    # this after the master has published the snapshot (see gunicorn.conf.py),
+    # so workers only map the shared snapshot and read its cube.
+    # With `lazy` (DASHBOARD_LAZY_START=1) the data loads in a background
+    # thread and the app answers health checks and serves the layout meanwhile.
+    if lazy is None:
+        lazy = os.environ.get('DASHBOARD_LAZY_START') == '1'
+
+    def warm_cache(state):
+        if os.environ.get('DASHBOARD_WARM_CACHE') == '1':
+            figure_cache.warm(state)
+            if state.sample is not None:
+                figure_cache.warm(state, exact=False)
+
+    # Swap in appended / rebuilt snapshots without a restart
+    reload_interval = float(os.environ.get('DASHBOARD_RELOAD_INTERVAL', 30))
+
+    def on_loaded(state):
+        warm_cache(state)
+        if reload_interval > 0:
+            store.watch(reload_interval, on_change=warm_cache)
+
+    # 1. Initialize data; with a sample fraction or latency budget the
+    # figures default to an approximate mode computed from a sample
+    if store is None:
+        store = DatasetStore(
+            sample_fraction=float(os.environ.get('DASHBOARD_SAMPLE_FRACTION', 0)) or None,
+            sample_budget=float(os.environ.get('DASHBOARD_SAMPLE_BUDGET_MS', 0)) / 1000 or None,
+            backend=os.environ.get('DASHBOARD_BACKEND', 'pandas'),
         )
-    ], style={'padding': '20px', 'backgroundColor': 'white', 'margin': '20px', 'borderRadius': '12px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.05)'}),
-    
-    # Navigation Tabs
-    dcc.Tabs(id='tabs', value='overview', children=[
-        dcc.Tab(label='📈 Overview', value='overview',
-                style={'fontWeight': 'bold'},
-                selected_style={'fontWeight': 'bold', 'color': '#667eea'}),
-        dcc.Tab(label='👥 Demographics', value='demographics',
-                style={'fontWeight': 'bold'},
-                selected_style={'fontWeight': 'bold', 'color': '#667eea'}),
-        dcc.Tab(label='💼 Work & Income', value='work',
-                style={'fontWeight': 'bold'},
-                selected_style={'fontWeight': 'bold', 'color': '#667eea'}),
-        dcc.Tab(label='🎓 Education', value='education',
-                style={'fontWeight': 'bold'},
-                selected_style={'fontWeight': 'bold', 'color': '#667eea'}),
-        dcc.Tab(label='💑 Relationships', value='relationships',
-                style={'fontWeight': 'bold'},
-                selected_style={'fontWeight': 'bold', 'color': '#667eea'}),
-    ], style={'margin': '0 20px 20px 20px'}),
-    
-    # Content Area
-    html.Div(id='tab-content', style={'padding': '0 20px 20px 20px'})
-])
-
-@app.callback(
-    Output('tab-content', 'children'),
-    [Input('tabs', 'value'),
-     Input('age-filter', 'value')]
-)
-def render_content(tab, selected_ages):
-    # 1. Filter data based on Age Dropdown
-    if not selected_ages:
-        return html.Div("Please select at least one age group.", style={'textAlign': 'center', 'padding': '50px'})
-    
-    filtered_df = data[data['age_range'].isin(selected_ages)]
-    
-    # 2. Generate updated figures for filtered data
-    figs = create_figures(filtered_df)
-    
-    if tab == 'overview':
-        return html.Div([
-            # Cards Section (Updated with filtered values)
+    # Insights tab statistics, computed in background processes and kept on
+    # disk per dataset version, age selection and filters
+    insight_runner = InsightRunner(store.snapshot_path + '.insights',
+                                   workers=int(os.environ.get('DASHBOARD_INSIGHT_WORKERS', 1)))
+
+    # Serialized figures per (age selection, tab, dataset version), with room
+    # for everything warm_cache() builds (both precisions when sampling)
+    cache_size = int(os.environ.get('DASHBOARD_CACHE_SIZE', 128))
+    if os.environ.get('DASHBOARD_WARM_CACHE') == '1':
+        warmed = len(list(age_selections())) * len(TAB_FIGURES) * (2 if store.sampling else 1)
+        cache_size = max(cache_size, warmed)
+    figure_cache = FigureCache(maxsize=cache_size)
+
+    if store.current is not None:
+        on_loaded(store.current)
+    elif lazy:
+        store.load_in_background(on_loaded)
+    else:
+        on_loaded(store.load())
+
+    app = dash.Dash(__name__)
+
+    # Latency histograms and cache counters on /metrics
+    metrics.init_app(app.server)
+    metrics.register_collector(figure_cache.collect)
+    metrics.register_collector(insight_runner.collect)
+
+    # gzip / brotli for the callback responses and the page
+    payload.init_app(app.server)
+
+    # Liveness answers as soon as the server is up; readiness once the data is loaded
+    @app.server.route('/health')
+    def health():
+        return jsonify(status='ok')
+
+    @app.server.route('/ready')
+    def ready():
+        state = store.current
+        if state is not None:
+            return jsonify(status='ready', version=state.version)
+        if store.error is not None:
+            return jsonify(status='failed', error=str(store.error)), 503
+        return jsonify(status='loading'), 503
+
+    app.layout = html.Div([
+        # Header
+        html.Div([
+            html.H1("📊 Adult Census Income",
+                    style={
+                        'textAlign': 'center',
+                        'color': 'white',
+                        'padding': '30px',
+                        'background': 'linear-gradient(135deg, #667eea 0%, #764ba2 100%)',
+                        'margin': '0',
+                        'boxShadow': '0 4px 6px rgba(0,0,0,0.1)'
+                    }),
+        ]),
+
+        # 2. Age Range Filter Section
+        html.Div([
+            html.Label("🔍 Filter by Age Group:", style={'fontWeight': 'bold', 'marginBottom': '10px', 'display': 'block'}),
+            dcc.Dropdown(
+                id='age-filter',
+                options=[{'label': age, 'value': age} for age in sorted(AGE_LABELS)],
+                value=list(AGE_LABELS),
+                multi=True,
+                placeholder="Select age groups...",
+                style={'width': '100%'}
+            ),
+
+            # Further filters; an empty dropdown keeps every value
             html.Div([
                 html.Div([
-                    html.H3("Total Records", style={'color': '#667eea'}),
-                    html.H2(f"{len(filtered_df):,}", style={'fontSize': '40px'})
-                ], className='stat-card'),
-                html.Div([
-                    html.H3("High Earners", style={'color': '#10b981'}),
-                    html.H2(f"{(filtered_df['income'] == '>50K').mean()*100:.1f}%", style={'fontSize': '40px'})
-                ], className='stat-card'),
-                html.Div([
-                    html.H3("Avg Age", style={'color': '#f59e0b'}),
-                    html.H2(f"{filtered_df['age'].mean():.1f}", style={'fontSize': '40px'})
-                ], className='stat-card'),
-                html.Div([
-                    html.H3("Avg Hours/Week", style={'color': '#ef4444'}),
-                    html.H2(f"{filtered_df['hours.per.week'].mean():.1f}", style={'fontSize': '40px'})
-                ], className='stat-card'),
-            ], style={'display': 'grid', 'gridTemplateColumns': 'repeat(4, 1fr)', 'gap': '20px', 'marginBottom': '30px'}),
-            
+                    html.Label(FILTER_LABELS[column], style={'fontWeight': 'bold', 'marginBottom': '5px', 'display': 'block'}),
+                    dcc.Dropdown(
+                        id=f'{column}-filter',
+                        options=[{'label': value, 'value': value} for value in CATEGORY_ORDERS.get(column, [])],
+                        value=[],
+                        multi=True,
+                        placeholder="All",
+                    ),
+                ]) for column in FILTER_COLUMNS
+            ], style={'display': 'grid', 'gridTemplateColumns': f'repeat({len(FILTER_COLUMNS)}, 1fr)', 'gap': '15px', 'marginTop': '15px'}),
+
+            # Approximate (sampled) or exact figures, offered when sampling is configured
+            dcc.RadioItems(
+                id='precision',
+                options=[{'label': ' Approximate (fast)', 'value': 'approximate'},
+                         {'label': ' Exact', 'value': 'exact'}],
+                value='approximate',
+                inline=True,
+                inputStyle={'marginLeft': '15px'},
+                style={'marginTop': '15px', 'display': 'block' if store.sampling else 'none'},
+            ),
+        ], style={'padding': '20px', 'backgroundColor': 'white', 'margin': '20px', 'borderRadius': '12px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.05)'}),
+
+        # Navigation Tabs
+        dcc.Tabs(id='tabs', value='overview', children=[
+            dcc.Tab(label='📈 Overview', value='overview',
+                    style={'fontWeight': 'bold'},
+                    selected_style={'fontWeight': 'bold', 'color': '#667eea'}),
+            dcc.Tab(label='👥 Demographics', value='demographics',
+                    style={'fontWeight': 'bold'},
+                    selected_style={'fontWeight': 'bold', 'color': '#667eea'}),
+            dcc.Tab(label='💼 Work & Income', value='work',
+                    style={'fontWeight': 'bold'},
+                    selected_style={'fontWeight': 'bold', 'color': '#667eea'}),
+            dcc.Tab(label='🎓 Education', value='education',
+                    style={'fontWeight': 'bold'},
+                    selected_style={'fontWeight': 'bold', 'color': '#667eea'}),
+            dcc.Tab(label='💑 Relationships', value='relationships',
+                    style={'fontWeight': 'bold'},
+                    selected_style={'fontWeight': 'bold', 'color': '#667eea'}),
+            dcc.Tab(label='🧠 Insights', value=INSIGHTS_TAB,
+                    style={'fontWeight': 'bold'},
+                    selected_style={'fontWeight': 'bold', 'color': '#667eea'}),
+        ], style={'margin': '0 20px 20px 20px'}),
+
+        # Content Area: one container per tab, kept once rendered and only
+        # re-rendered when the selection or the dataset changed
+        html.Div([
+            html.Div(
+                [stat_cards(), html.Div(loading_layout(), id='content-overview')] if tab == 'overview'
+                else html.Div(loading_layout(), id=f'content-{tab}'),
+                id=f'tab-{tab}', style={'display': 'block' if tab == 'overview' else 'none'},
+            ) for tab in TABS
+        ], style={'padding': '0 20px 20px 20px'}),
+
+        # Per age group sums for the current filters, used for the stat cards
+        # in the browser; the tab each container was last rendered for
+        dcc.Store(id='age-aggregates'),
+        dcc.Store(id='render-request'),
+        dcc.Store(id='rendered-tabs', data={}),
+        # Polls until the data has loaded, then switches itself off
+        dcc.Interval(id='data-ready-poll', interval=1000, disabled=store.current is not None),
+        # Picks up new dataset versions
+        dcc.Interval(id='version-poll', interval=max(reload_interval, 1) * 1000, disabled=reload_interval <= 0),
+        # Asks again for the insights tab while its statistics are computed
+        dcc.Interval(id='insights-poll', interval=2000, disabled=True),
+    ])
+
+    @app.callback(
+        [Output('age-aggregates', 'data'),
+         Output('data-ready-poll', 'disabled')],
+        [Input('data-ready-poll', 'n_intervals'),
+         Input('version-poll', 'n_intervals'),
+         *[Input(f'{column}-filter', 'value') for column in FILTER_COLUMNS]],
+        State('age-aggregates', 'data')
+    )
+    def age_aggregates(_ready_ticks, _version_ticks, *args):
+        *filter_values, previous = args
+        state = store.current
+        if state is None:
+            if store.error is None:
+                return no_update, False
+            return {'error': str(store.error)}, True
+
+        filters = {column: list(values) for column, values in filter_key(dict(zip(FILTER_COLUMNS, filter_values)))}
+        if previous and previous.get('version') == state.version and previous.get('filters') == filters:
+            return no_update, True
+        groups = state.cube.totals_by_age(filters)
+        return {
+            'version': state.version,
+            'filters': filters,
+            'groups': {age: {measure: int(value) for measure, value in row.items()} for age, row in groups.iterrows()},
+        }, True
+
+    # Stat cards, tab switching and deciding whether a tab needs rendering
+    # run in the browser (assets/dashboard.js)
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard', function_name='statCards'),
+        [Output(f'kpi-{kpi}', 'children') for kpi in STAT_CARDS],
+        [Input('age-filter', 'value'),
+         Input('age-aggregates', 'data')]
+    )
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard', function_name='showTab'),
+        [Output(f'tab-{tab}', 'style') for tab in TABS],
+        Input('tabs', 'value')
+    )
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard', function_name='requestRender'),
+        Output('render-request', 'data'),
+        [Input('tabs', 'value'),
+         Input('age-filter', 'value'),
+         Input('age-aggregates', 'data'),
+         Input('precision', 'value'),
+         Input('insights-poll', 'n_intervals')],
+        State('rendered-tabs', 'data')
+    )
+
+    @app.callback(
+        [*[Output(f'content-{tab}', 'children') for tab in TABS],
+         Output('rendered-tabs', 'data'),
+         Output('insights-poll', 'disabled')],
+        Input('render-request', 'data'),
+        State('rendered-tabs', 'data')
+    )
+    @profiled
+    def render_content(request, rendered):
+        if not request:
+            raise PreventUpdate
+        tab = request['tab']
+        children, pending = tab_content(tab, request['ages'], request['filters'], request.get('exact', True))
+        # A pending tab is not marked as rendered, so insights-poll asks for it again
+        if not pending:
+            rendered = {**(rendered or {}), tab: request['signature']}
+        return [*(children if name == tab else no_update for name in TABS),
+                rendered or {}, not pending]
+
+    def tab_content(tab, selected_ages, filters, exact=True):
+        # The tab's children, and whether they are still being computed
+        # 1. Wait for the data; one dataset version is used for the whole request
+        state = store.current
+        if state is None:
+            return loading_layout(store.error), False
+
+        # 2. Filter data based on Age Dropdown; unknown filter columns from
+        # the client are dropped, as FigureCache.get does
+        filters = dict(filter_key(filters))
+        if not selected_ages:
+            return html.Div("Please select at least one age group.", style={'textAlign': 'center', 'padding': '50px'}), False
+        if state.cube.totals(selected_ages, filters)['count'] == 0:
+            return html.Div("No records match the selected filters.", style={'textAlign': 'center', 'padding': '50px'}), False
+
+        # 3. Insights are shown once the background runner has computed them
+        if tab == INSIGHTS_TAB:
+            result = insight_runner.get(state, selected_ages, filters)
+            if result is None:
+                return insights_pending(), True
+            with span('layout', tab=tab):
+                return insights_layout(result), False
+
+        # 4. Get the active tab's figures for this selection (cached)
+        figures_json = figure_cache.get(state, selected_ages, tab, filters, exact)
+        with span('decode', tab=tab):
+            figs = {name: payload.loads(fig) for name, fig in figures_json.items()}
+
+        # 5. Lay out the tab
+        with span('layout', tab=tab):
+            if exact or state.sample is None:
+                return tab_layout(tab, figs), False
+            return html.Div([sample_banner(state.sample), tab_layout(tab, figs)]), False
+
+    # Offer the values present in the loaded data (e.g. workclass has no fixed list)
+    @app.callback(
+        [Output(f'{column}-filter', 'options') for column in FILTER_COLUMNS],
+        Input('data-ready-poll', 'disabled')
+    )
+    def filter_options(_disabled):
+        state = store.current
+        if state is None:
+            raise PreventUpdate
+        return [[{'label': value, 'value': value} for value in state.backend.values(column)]
+                for column in FILTER_COLUMNS]
+
+    app.index_string = INDEX_STRING
+    return app
+
+
+# Figure tabs plus the insights tab
+TABS = [*TAB_FIGURES, INSIGHTS_TAB]
+
+FILTER_LABELS = {
+    'sex': "Sex",
+    'race': "Race",
+    'workclass': "Workclass",
+    'education_level': "Education",
+    'native': "Native",
+}
+
+
+def loading_layout(error=None):
+    if error is not None:
+        return html.Div("The census data could not be loaded. Check the server logs.",
+                        style={'textAlign': 'center', 'padding': '50px', 'color': '#ef4444'})
+    return html.Div("⏳ Loading the census data...", style={'textAlign': 'center', 'padding': '50px'})
+
+
+def sample_banner(sample):
+    return html.Div(
+        f"≈ Approximate: charts are computed from a stratified sample of {len(sample.rows):,} rows "
+        f"({sample.fraction:.1%} of each age group and income class), so their counts are estimates and "
+        "probabilities show 95% confidence intervals. The stat cards are exact. Switch to Exact above for the full data.",
+        style={'padding': '10px 15px', 'marginBottom': '20px', 'borderRadius': '8px',
+               'backgroundColor': '#fef3c7', 'color': '#92400e'}
+    )
+
+
+# Overview stat cards: id suffix -> (title, colour); values are set by the
+# statCards clientside callback
+STAT_CARDS = {
+    'count': ("Total Records", '#667eea'),
+    'high-earners': ("High Earners", '#10b981'),
+    'age': ("Avg Age", '#f59e0b'),
+    'hours': ("Avg Hours/Week", '#ef4444'),
+}
+
+
+def stat_cards():
+    # Cards Section (Updated with filtered values)
+    return html.Div([
+        html.Div([
+            html.H3(title, style={'color': color}),
+            html.H2("–", id=f'kpi-{kpi}', style={'fontSize': '40px'})
+        ], className='stat-card')
+        for kpi, (title, color) in STAT_CARDS.items()
+    ], style={'display': 'grid', 'gridTemplateColumns': 'repeat(4, 1fr)', 'gap': '20px', 'marginBottom': '30px'})
+
+
+def tab_layout(tab, figs):
+    if tab == 'overview':
+        return html.Div([
             # Graphs Section
             html.Div([
                 html.Div([dcc.Graph(figure=figs['fig_age'])], style={'width': '50%'}),
@@ -157,8 +420,46 @@ def render_content(tab, selected_ages):
             ], style={'display': 'flex', 'gap': '20px'}),
         ])
 
+def insights_pending():
+    return html.Div([
+        html.H2("🧠 Income Insights", style={'color': '#667eea', 'marginBottom': '20px'}),
+        html.Div("⏳ Computing mutual information, odds ratios and a logistic regression for this selection...",
+                 style={'textAlign': 'center', 'padding': '50px'}),
+    ])
+
+
+def insights_layout(result):
+    header = html.H2("🧠 Income Insights", style={'color': '#667eea', 'marginBottom': '20px'})
+    if 'error' in result:
+        return html.Div([header, html.Div("Computing the insights for this selection failed. Check the server logs.",
+                                          style={'textAlign': 'center', 'padding': '50px', 'color': '#ef4444'})])
+    if 'logistic' not in result:
+        return html.Div([header, html.Div("Every selected record is in the same income class, so there is nothing to compare.",
+                                          style={'textAlign': 'center', 'padding': '50px'})])
+    if not result['odds_ratios']:
+        return html.Div([header, html.Div("Every feature has a single value in this selection, so there is nothing to compare.",
+                                          style={'textAlign': 'center', 'padding': '50px'})])
+
+    figs = {name: payload.loads(payload.figure_to_json(fig)) for name, fig in insight_figures(result).items()}
+    logistic = result['logistic']
+    summary = (
+        f"{result['rows']:,} records, {result['high_earners'] / result['rows']:.1%} earning >50K. "
+        "Odds ratios and coefficients are relative to each feature's most common value. "
+        f"The regression {'converged' if logistic['converged'] else 'did not converge'} "
+        f"after {logistic['iterations']} iterations."
+    )
+    return html.Div([
+        header,
+        html.P(summary, style={'color': '#4b5563'}),
+        dcc.Graph(figure=figs['fig_mutual_information']),
+        html.Div([
+            html.Div([dcc.Graph(figure=figs['fig_odds_ratios'])], style={'width': '50%'}),
+            html.Div([dcc.Graph(figure=figs['fig_logistic'])], style={'width': '50%'}),
+        ], style={'display': 'flex', 'gap': '20px'}),
+    ])
+
 # CSS remains the same
-app.index_string = '''
+INDEX_STRING = '''
 <!DOCTYPE html>
 <html>
     <head>
@@ -193,5 +494,11 @@ app.index_string = '''
 </html>
 '''
 
+
+def create_server():
+    # WSGI entry point: gunicorn "app:create_server()"
+    return create_app().server
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
@@ -0,0 +1,53 @@
+// Clientside callbacks registered in app.py. They answer the interactions
+// that need no new aggregation in the browser, so only changed selections
+// reach the server.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    dashboard: {
+        // Overview stat cards from the per-age-group sums in `age-aggregates`
+        statCards: function(selectedAges, aggregates) {
+            var empty = ['–', '–', '–', '–'];
+            if (!aggregates || !aggregates.groups || !selectedAges || !selectedAges.length) {
+                return empty;
+            }
+            var totals = {count: 0, high_earners: 0, age_sum: 0, hours_sum: 0};
+            selectedAges.forEach(function(age) {
+                var group = aggregates.groups[age];
+                if (group) {
+                    Object.keys(totals).forEach(function(key) { totals[key] += group[key]; });
+                }
+            });
+            if (!totals.count) {
+                return empty;
+            }
+            return [
+                totals.count.toLocaleString('en-US'),
+                (totals.high_earners / totals.count * 100).toFixed(1) + '%',
+                (totals.age_sum / totals.count).toFixed(1),
+                (totals.hours_sum / totals.count).toFixed(1),
+            ];
+        },
+
+        // Show the selected tab's container and hide the others
+        showTab: function(tab) {
+            return dash_clientside.callback_context.outputs_list.map(function(output) {
+                return {display: output.id === 'tab-' + tab ? 'block' : 'none'};
+            });
+        },
+
+        // Ask the server to render the active tab, unless it was already
+        // rendered for the same ages, filters, precision and dataset version.
+        // insights-poll ticks re-run this while the insights tab is pending.
+        requestRender: function(tab, selectedAges, aggregates, precision, _pollTicks, rendered) {
+            if (!aggregates) {
+                return dash_clientside.no_update;
+            }
+            var ages = (selectedAges || []).slice().sort();
+            var signature = JSON.stringify([ages, aggregates.filters || {}, precision, aggregates.version || null]);
+            if (rendered && rendered[tab] === signature) {
+                return dash_clientside.no_update;
+            }
+            return {tab: tab, signature: signature, ages: ages, filters: aggregates.filters || {},
+                    exact: precision === 'exact'};
+        },
+    },
+});
@@ -0,0 +1,272 @@
+# ==============================
+# Performance Benchmarks
+# ==============================
+# Times data loading, age filtering, the query backends and every figure
+# builder on synthetic census extracts of increasing size and writes a JSON
+# file that can be compared between commits:
+#
+#   python benchmark.py --output bench.json
+#   python benchmark.py --sizes 32561,1000000 --compare bench.json
+import os
+import gzip
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import plotly
+import data_processing as dp
+from dashboard_layouts import FIGURE_BUILDERS, TAB_FIGURES, Aggregates
+from payload import figure_to_json
+from query_backend import PandasBackend, DuckDBBackend, duckdb
+
+DEFAULT_SIZES = [32_561, 1_000_000, 10_000_000]
+
+# Categorical columns of the raw Adult CSV with rough real-world frequencies
+RAW_CATEGORIES = {
+    "workclass": {
+        "Private": .70, "Self-emp-not-inc": .08, "Local-gov": .06, "?": .06, "State-gov": .04,
+        "Self-emp-inc": .03, "Federal-gov": .03,
+    },
+    "marital.status": {
+        "Married-civ-spouse": .46, "Never-married": .33, "Divorced": .14, "Separated": .03,
+        "Widowed": .03, "Married-spouse-absent": .01,
+    },
+    "occupation": {
+        **{occ: .06 for occ in dp.OCCUPATION_GROUPS},
+        "Adm-clerical": .12, "?": .04,
+    },
+    "relationship": {
+        "Husband": .40, "Not-in-family": .26, "Own-child": .16, "Unmarried": .10,
+        "Wife": .05, "Other-relative": .03,
+    },
+    "race": {"White": .85, "Black": .10, "Asian-Pac-Islander": .03, "Amer-Indian-Eskimo": .01, "Other": .01},
+    "sex": {"Male": .67, "Female": .33},
+    "native.country": {"United-States": .90, "Mexico": .02, "?": .02, "Philippines": .01, "Germany": .01, "India": .04},
+}
+EDUCATION_LEVELS = list(dp.EDUCATION_GROUPS)  # ordered from Preschool to Doctorate
+
+
+def make_synthetic_census(n_rows, seed=0):
+    # Raw frame with the Kaggle CSV's schema; income depends on education,
+    # age and hours so the charts show realistic contrasts
+    rng = np.random.default_rng(seed)
+    raw = {}
+    for col, freqs in RAW_CATEGORIES.items():
+        p = np.array(list(freqs.values()))
+        raw[col] = rng.choice(list(freqs), size=n_rows, p=p / p.sum())
+
+    education_num = np.clip(rng.normal(10, 2.5, n_rows).round(), 1, 16).astype("int64")
+    age = np.clip(rng.gamma(6, 6.5, n_rows).round() + 17, 17, 90).astype("int64")
+    hours = np.clip(rng.normal(40, 12, n_rows).round(), 1, 99).astype("int64")
+    logit = -9 + 0.45 * education_num + 0.04 * age + 0.03 * hours
+    high = rng.random(n_rows) < 1 / (1 + np.exp(-logit))
+
+    return pd.DataFrame({
+        "age": age,
+        "workclass": raw["workclass"],
+        "fnlwgt": rng.integers(12_000, 1_500_000, n_rows),
+        "education": np.array(EDUCATION_LEVELS)[education_num - 1],
+        "education.num": education_num,
+        "marital.status": raw["marital.status"],
+        "occupation": raw["occupation"],
+        "relationship": raw["relationship"],
+        "race": raw["race"],
+        "sex": raw["sex"],
+        "capital.gain": np.where(rng.random(n_rows) < .08, rng.integers(100, 99_999, n_rows), 0),
+        "capital.loss": np.where(rng.random(n_rows) < .05, rng.integers(100, 4_356, n_rows), 0),
+        "hours.per.week": hours,
+        "native.country": raw["native.country"],
+        "income": np.where(high, ">50K", "<=50K"),
+    })
+
+
+def _measure(fn, repeat=1, memory=True):
+    # Best wall time over `repeat` runs; peak memory comes from one extra
+    # traced run, since tracemalloc slows allocation-heavy code a lot
+    result, best = None, float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    timing = {"seconds": round(best, 6)}
+    if memory:
+        tracemalloc.start()
+        fn()
+        timing["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        tracemalloc.stop()
+    return result, timing
+
+
+def run_size(n_rows, selection, repeat=1, with_csv=True, seed=0):
+    stages = {}
+    raw = make_synthetic_census(n_rows, seed)
+
+    if with_csv:
+        # Full get_cleaned_data path from a local CSV
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, "adult.csv")
+            raw.to_csv(csv_path, index=False)
+            _, stages["get_cleaned_data"] = _measure(lambda: dp.get_cleaned_data(csv_path))
+
+    engineered, stages["clean_data"] = _measure(lambda: dp.clean_data(raw), repeat)
+    data, stages["compact_data"] = _measure(lambda: dp.compact_data(engineered), repeat)
+    del raw, engineered
+    cube, stages["build_cube"] = _measure(lambda: dp.build_cube(data), repeat)
+
+    # Age filter as render_content does it, and the row filter it replaced
+    selected, stages["filter_cube"] = _measure(
+        lambda: (cube.select(selection), cube.totals(selection))[0], repeat
+    )
+    _, stages["filter_rows"] = _measure(lambda: data[data["age_range"].isin(selection)], repeat)
+
+    # A demographic filter through each query backend (distributions re-queried)
+    filters = {"sex": ["Female"], "workclass": ["Private"]}
+    pandas_backend = PandasBackend(data)
+    _, stages["filter_pandas"] = _measure(lambda: pandas_backend.select_cube(cube, selection, filters), repeat)
+    if duckdb is not None:
+        with tempfile.TemporaryDirectory() as tmp:
+            parquet_path = os.path.join(tmp, "census.parquet")
+            data.to_parquet(parquet_path)
+            duckdb_backend = DuckDBBackend(parquet_path)
+            _, stages["build_cube_duckdb"] = _measure(duckdb_backend.build_cube, repeat)
+            _, stages["filter_duckdb"] = _measure(lambda: duckdb_backend.select_cube(cube, selection, filters), repeat)
+    agg, stages["aggregate"] = _measure(lambda: Aggregates(selected, FIGURE_BUILDERS), repeat)
+
+    figures, payloads = {}, {}
+    for name, builder in FIGURE_BUILDERS.items():
+        fig, timing = _measure(lambda: builder(agg), repeat, memory=False)
+        payload, serialize = _measure(fig.to_json, repeat, memory=False)
+        trimmed, serialize_trimmed = _measure(lambda: figure_to_json(fig), repeat, memory=False)
+        figures[name] = {
+            **timing,
+            "serialize_seconds": serialize["seconds"],
+            "json_bytes": len(payload),
+            "trimmed_serialize_seconds": serialize_trimmed["seconds"],
+            "trimmed_json_bytes": len(trimmed),
+        }
+        payloads[name] = (payload, trimmed)
+
+    # Bytes a tab's figures take on the wire: plain to_json() vs the trimmed
+    # template, each raw and gzipped as one response body
+    tabs = {}
+    for tab, names in TAB_FIGURES.items():
+        plain = ",".join(payloads[name][0] for name in names).encode()
+        trimmed = ",".join(payloads[name][1] for name in names).encode()
+        tabs[tab] = {
+            "json_bytes": len(plain),
+            "trimmed_json_bytes": len(trimmed),
+            "gzip_bytes": len(gzip.compress(plain)),
+            "trimmed_gzip_bytes": len(gzip.compress(trimmed)),
+        }
+
+    return {
+        "rows": n_rows,
+        "selection": list(selection),
+        "cube_rows": len(cube.counts),
+        "stages": stages,
+        "figures": figures,
+        "payloads": tabs,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, selection=("Young", "Adult"), repeat=1, with_csv=True):
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "plotly": plotly.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "results": {str(n): run_size(n, list(selection), repeat, with_csv) for n in sizes},
+    }
+
+
+def compare(current, baseline, threshold=1.25):
+    # Rows of (size, metric, baseline, current, ratio); regressions are the
+    # timings that grew by more than `threshold`
+    rows, regressions = [], []
+    for size, result in current["results"].items():
+        base = baseline["results"].get(size)
+        if base is None:
+            continue
+        metrics = {f"stage:{k}": v["seconds"] for k, v in result["stages"].items()}
+        metrics.update({f"figure:{k}": v["seconds"] for k, v in result["figures"].items()})
+        base_metrics = {f"stage:{k}": v["seconds"] for k, v in base["stages"].items()}
+        base_metrics.update({f"figure:{k}": v["seconds"] for k, v in base["figures"].items()})
+        for metric, seconds in metrics.items():
+            if metric not in base_metrics or base_metrics[metric] == 0:
+                continue
+            ratio = seconds / base_metrics[metric]
+            rows.append((size, metric, base_metrics[metric], seconds, ratio))
+            if ratio > threshold:
+                regressions.append(rows[-1])
+    return rows, regressions
+
+
+def _print_summary(report):
+    for size, result in report["results"].items():
+        print(f"\n== {int(size):,} rows (cube: {result['cube_rows']:,} rows) ==")
+        for name, stage in result["stages"].items():
+            print(f"  {name:<24} {stage['seconds']:>9.4f}s  peak {stage['peak_mb']:>9.1f} MiB")
+        for name, fig in result["figures"].items():
+            print(f"  {name:<24} {fig['seconds']:>9.4f}s  json {fig['json_bytes'] / 1024:>9.1f} KiB")
+        for tab, sizes in result.get("payloads", {}).items():
+            saved = 1 - sizes["trimmed_gzip_bytes"] / sizes["json_bytes"]
+            print(f"  payload:{tab:<16} {sizes['json_bytes'] / 1024:>7.1f} KiB -> "
+                  f"{sizes['trimmed_json_bytes'] / 1024:>7.1f} KiB trimmed, "
+                  f"{sizes['trimmed_gzip_bytes'] / 1024:>6.1f} KiB gzipped ({saved:.0%} saved)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark data loading, filtering and figure generation.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated row counts (default: %(default)s)")
+    parser.add_argument("--selection", default="Young,Adult", help="age groups to filter on")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per measurement; the best time is kept")
+    parser.add_argument("--skip-csv", action="store_true", help="skip the CSV round trip through get_cleaned_data")
+    parser.add_argument("--output", default="benchmark_results.json", help="results file (default: %(default)s)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown ratio reported as a regression (default: %(default)s)")
+    args = parser.parse_args()
+
+    report = run_benchmarks(
+        sizes=[int(n) for n in args.sizes.split(",")],
+        selection=args.selection.split(","),
+        repeat=args.repeat,
+        with_csv=not args.skip_csv,
+    )
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    _print_summary(report)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(report, baseline, args.threshold)
+        print(f"\nCompared with {args.compare} ({baseline['meta'].get('commit')}):")
+        for size, metric, before, after, ratio in rows:
+            flag = "  <-- regression" if ratio > args.threshold else ""
+            print(f"  {int(size):>10,} {metric:<32} {before:>9.4f}s -> {after:>9.4f}s  x{ratio:.2f}{flag}")
+        if regressions:
+            raise SystemExit(f"{len(regressions)} timing(s) regressed by more than x{args.threshold}")
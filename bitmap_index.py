@@ -0,0 +1,92 @@
+# ==============================
+# Bitmap Index
+# ==============================
+# One packed bitset per value of each indexed column, with bit i set when
+# row i has that value. A filter is an OR over the chosen values of a column
+# and an AND across columns, done on 64-bit words: n/64 operations per value
+# instead of a comparison per row.
+#
+# Counts and sums come from the cube for any filter, because the filter
+# columns are cube dimensions. Only the value-count distributions (box plots,
+# histograms) are rebuilt, from the rows the bitmaps select. For a weighted
+# sample they are weighted by its `weight` column.
+import numpy as np
+from data_processing import AggregateCube, CUBE_DISTRIBUTIONS, build_distributions
+
+FILTER_COLUMNS = ["sex", "race", "workclass", "education_level", "native"]
+INDEX_COLUMNS = ["age_range", *FILTER_COLUMNS]
+
+# Columns build_distributions() reads
+DISTRIBUTION_COLUMNS = list(dict.fromkeys(
+    ["age_range", *(key for keys in CUBE_DISTRIBUTIONS.values() for key in keys), *CUBE_DISTRIBUTIONS]
+))
+
+
+def filter_key(filters):
+    # Hashable, order-independent form of {column: values}; columns without
+    # a selection are left out, so no filters at all gives ()
+    filters = filters or {}
+    return tuple(
+        (column, tuple(sorted(set(filters[column]))))
+        for column in FILTER_COLUMNS if filters.get(column)
+    )
+
+
+def _pack(mask):
+    # Bool array -> bits packed into uint64 words (zero-padded at the end)
+    packed = np.packbits(mask)
+    padded = np.zeros(-(-len(packed) // 8) * 8, dtype=np.uint8)
+    padded[:len(packed)] = packed
+    return padded.view(np.uint64)
+
+
+class BitmapIndex:
+    def __init__(self, data, columns=INDEX_COLUMNS, weight=None):
+        self.data = data
+        self.weight = weight
+        self.n_rows = len(data)
+        self.bitmaps = {}   # column -> {value: packed words}
+        for column in columns:
+            codes = data[column].cat.codes.to_numpy()
+            self.bitmaps[column] = {
+                value: _pack(codes == code)
+                for code, value in enumerate(data[column].cat.categories)
+            }
+
+    def values(self, column):
+        # Values of `column` that occur in at least one row
+        return [value for value, words in self.bitmaps[column].items() if words.any()]
+
+    def mask(self, selections):
+        # Packed words of the rows matching {column: values}, or None when
+        # nothing is filtered
+        result = None
+        for column, values in selections.items():
+            if not values:
+                continue
+            bitmaps = self.bitmaps[column]
+            words = [bitmaps[value] for value in values if value in bitmaps]
+            if words:
+                column_words = np.bitwise_or.reduce(words) if len(words) > 1 else words[0]
+            else:
+                column_words = np.zeros(-(-self.n_rows // 64), dtype=np.uint64)
+            result = column_words if result is None else result & column_words
+        return result
+
+    def rows(self, selections):
+        # Positions of the rows matching {column: values}
+        words = self.mask(selections)
+        if words is None:
+            return np.arange(self.n_rows)
+        return np.flatnonzero(np.unpackbits(words.view(np.uint8), count=self.n_rows))
+
+    def select_cube(self, cube, age_ranges, filters=None):
+        # cube.select(age_ranges), further restricted to `filters`
+        key = filter_key(filters)
+        if not key:
+            return cube.select(age_ranges)
+        counts = cube.counts[cube.matching(age_ranges, dict(key))]
+        rows = self.rows({"age_range": age_ranges, **dict(key)})
+        columns = DISTRIBUTION_COLUMNS if self.weight is None else [*DISTRIBUTION_COLUMNS, self.weight]
+        distributions = build_distributions(self.data[columns].take(rows), self.weight)
+        return AggregateCube(counts, distributions)
@@ -1,205 +1,411 @@
 # ==============================
 # Create All Figures
 # ==============================
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import numpy as np
 import plotly.express as px
-import pandas as pd
+import plotly.graph_objects as go
+from data_processing import AggregateCube, SAMPLE_COLUMN, build_cube
+from metrics import observe, span
+from payload import figure_to_json
 
-def create_figures(data):
-        
-    # 1. Age Distribution
-    fig_age = px.histogram(
-        data, x='age', nbins=20, 
+logger = logging.getLogger(__name__)
+
+# Above this many selected rows, box plots and histograms are sent as
+# summary statistics / bins computed here instead of one point per row
+AGGREGATE_THRESHOLD = int(os.environ.get('DASHBOARD_AGGREGATE_THRESHOLD', 50_000))
+
+# With more than one worker, a request's figures are built concurrently on a
+# shared pool of threads (or processes with DASHBOARD_FIGURE_POOL=process).
+# A figure that fails or is not done within FIGURE_TIMEOUT seconds of the
+# request is replaced by fallback_figure().
+FIGURE_WORKERS = int(os.environ.get('DASHBOARD_FIGURE_WORKERS', 0))
+FIGURE_POOL = os.environ.get('DASHBOARD_FIGURE_POOL', 'thread')
+FIGURE_TIMEOUT = float(os.environ.get('DASHBOARD_FIGURE_TIMEOUT', 10))
+
+
+# Box plots need the individual points: rebuild them from value counts
+def _expand(dist):
+    return dist.loc[dist.index.repeat(dist['count'])].drop(columns='count')
+
+
+def _weighted_quantile(values, counts, q):
+    # Same interpolation plotly.js uses for box quartiles, on sorted value counts
+    cum = np.cumsum(counts)
+    pos = min(max(q * cum[-1] - 0.5, 0), cum[-1] - 1)
+    lo, hi = np.floor(pos), np.ceil(pos)
+    v_lo = values[np.searchsorted(cum, lo, side='right')]
+    v_hi = values[np.searchsorted(cum, hi, side='right')]
+    return v_lo + (pos - lo) * (v_hi - v_lo)
+
+
+def _box_stats(values, counts):
+    q1, median, q3 = (_weighted_quantile(values, counts, q) for q in (0.25, 0.5, 0.75))
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    return {
+        'q1': [q1], 'median': [median], 'q3': [q3],
+        'lowerfence': [min(inside.min(), q1)], 'upperfence': [max(inside.max(), q3)],
+        'mean': [np.average(values, weights=counts)],
+    }
+
+
+def _box_figure(agg, value, by, title, color_discrete_map=None):
+    dist = agg.distribution(value, [by])
+    if agg.n_rows <= AGGREGATE_THRESHOLD:
+        return px.box(
+            _expand(dist), x=by, y=value, color=by,
+            color_discrete_map=color_discrete_map, title=title
+        )
+
+    # One precomputed box per group, coloured like px.box would
+    colors = px.colors.qualitative.Plotly
+    fig = go.Figure()
+    for i, (key, group) in enumerate(dist.groupby(by, observed=True, sort=True)):
+        color = (color_discrete_map or {}).get(key, colors[i % len(colors)])
+        fig.add_trace(go.Box(
+            name=str(key), x=[key], marker_color=color, boxpoints=False,
+            **_box_stats(group[value].to_numpy(), group['count'].to_numpy())
+        ))
+    fig.update_layout(title=title, xaxis_title=by, yaxis_title=value, legend_title_text=by)
+    return fig
+
+
+def _histogram_figure(agg, value, nbins, title, color, labels):
+    dist = agg.distribution(value)
+    if agg.n_rows <= AGGREGATE_THRESHOLD:
+        return px.histogram(
+            dist, x=value, y='count', histfunc='sum', nbins=nbins, title=title,
+            color_discrete_sequence=[color], labels=labels
+        )
+
+    counts, edges = np.histogram(dist[value], bins=nbins, weights=dist['count'])
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges),
+        marker_color=color
+    ))
+    fig.update_layout(title=title, xaxis_title=labels.get(value, value), bargap=0)
+    return fig
+
+
+def _wilson_interval(rate, n, z=1.96):
+    # 95% Wilson score interval of a proportion observed on n sampled rows
+    centre = (rate + z**2 / (2 * n)) / (1 + z**2 / n)
+    half = z / (1 + z**2 / n) * np.sqrt(rate * (1 - rate) / n + z**2 / (4 * n**2))
+    return centre - half, centre + half
+
+
+def _rate_error_bars(frame, rate):
+    # px.bar error bar arguments for the `rate` column of a rollup from a
+    # sample; no arguments (no error bars) for an exact one
+    if 'rate_low' not in frame:
+        return {}
+    frame['error_plus'] = frame['rate_high'] - frame[rate]
+    frame['error_minus'] = frame[rate] - frame['rate_low']
+    return {'error_y': 'error_plus', 'error_y_minus': 'error_minus'}
+
+
+# ==============================
+# Shared Aggregation Layer
+# ==============================
+# Rollups of one cube selection shared by the figure builders of a request:
+# the cube is scanned once, down to the union of the keys the requested
+# figures group by, and each figure's grouping is derived from that
+class Aggregates:
+    def __init__(self, cube, names):
+        self.cube = cube
+        self._keys = list(dict.fromkeys(
+            key for name in names for grouping in FIGURE_GROUPINGS.get(name, []) for key in grouping
+        ))
+        self._base = cube.rollup(self._keys) if self._keys else cube.counts
+        self._rollups = {}
+
+    @property
+    def n_rows(self):
+        return self.cube.n_rows
+
+    def distribution(self, column, keys=()):
+        dist = self.cube.distribution(column, keys)
+        if SAMPLE_COLUMN in self.cube.counts:
+            dist['count'] = dist['count'].round().astype('int64')
+        return dist
+
+    def rollup(self, keys):
+        # Counts, sums and high-earner rate per group; callers get their own
+        # copy. From a sample, also the rate's confidence interval, and the
+        # weighted counts are rounded to whole rows once they are summed.
+        keys = tuple(keys)
+        if keys not in self._rollups:
+            source = self._base if set(keys) <= set(self._keys) else self.cube.counts
+            rollup = (
+                source.groupby(list(keys), observed=True, sort=True)[self.cube.measures]
+                .sum()
+                .reset_index()
+            )
+            rollup['rate'] = rollup['high_earners'] / rollup['count']
+            if SAMPLE_COLUMN in rollup:
+                rollup['rate_low'], rollup['rate_high'] = _wilson_interval(rollup['rate'], rollup[SAMPLE_COLUMN])
+                rollup[['count', 'high_earners']] = rollup[['count', 'high_earners']].round().astype('int64')
+            self._rollups[keys] = rollup
+        return self._rollups[keys].copy()
+
+    def compact(self):
+        # Copy that keeps only the base rollup in place of the cube's counts,
+        # small enough to send to a worker process with every figure
+        if not self._keys:
+            return self
+        slim = Aggregates(AggregateCube(self._base, self.cube.distributions), [])
+        slim._keys, slim._base = self._keys, self._base
+        return slim
+
+
+# 1. Age Distribution
+def fig_age(agg):
+    fig = _histogram_figure(
+        agg, 'age', nbins=20,
         title='Distribution of Age',
-        color_discrete_sequence=['#3b82f6'],
+        color='#3b82f6',
         labels={'age': 'Age', 'count': 'Count'}
     )
-    fig_age.update_layout(template="plotly_white", showlegend=False)
+    fig.update_layout(template="plotly_white", showlegend=False, yaxis_title='Count')
+    return fig
 
-    # 2. Hours per Week vs Income
-    fig_hours_income = px.box(
-        data, x='income', y='hours.per.week',
-        color='income',
+
+# 2. Hours per Week vs Income
+def fig_hours_income(agg):
+    fig = _box_figure(
+        agg, 'hours.per.week', 'income',
         color_discrete_map={'<=50K':'#60a5fa', '>50K':'#f87171'},
         title='Hours per Week vs Income'
     )
-    fig_hours_income.update_layout(template="plotly_white")
+    fig.update_layout(template="plotly_white")
+    return fig
 
-    # 3. Income by Gender
-    fig_gender = px.histogram(
-        data, x='sex', color='income',
+
+# 3. Income by Gender
+def fig_gender(agg):
+    fig = px.bar(
+        agg.rollup(['sex', 'income']), x='sex', y='count', color='income',
         barmode='group',
         color_discrete_map={'<=50K':'#3b82f6', '>50K':'#f97316'},
         text_auto=True,
         title='Income Distribution by Sex'
     )
-    fig_gender.update_traces(marker_line_width=0)
-    fig_gender.update_layout(template="plotly_white")
+    fig.update_traces(marker_line_width=0)
+    fig.update_layout(template="plotly_white")
+    return fig
+
 
-    # 4. Income Distribution (Target)
-    fig_income_dist = px.histogram(
-        data, x="income",
+# 4. Income Distribution (Target)
+def fig_income_dist(agg):
+    fig = px.bar(
+        agg.rollup(['income']), x="income", y="count",
         color_discrete_sequence=['#8b5cf6'],
         title="Income Distribution (Target Variable)"
     )
-    fig_income_dist.update_layout(template="plotly_white")
+    fig.update_layout(template="plotly_white")
+    return fig
 
-    # 5. Income by Race
-    fig_race = px.histogram(
-        data, x="race", color="income",
+
+# 5. Income by Race
+def fig_race(agg):
+    fig = px.bar(
+        agg.rollup(['race', 'income']), x="race", y="count", color="income",
         barmode="group",
         color_discrete_map={'<=50K':'#3b82f6', '>50K':'#10b981'},
         title="Income by Race"
     )
-    fig_race.update_layout(template="plotly_white")
+    fig.update_layout(template="plotly_white")
+    return fig
+
 
-    # 6. US vs Non-US
-    fig_native = px.histogram(
-        data, x="native", color="income",
+# 6. US vs Non-US
+def fig_native(agg):
+    fig = px.bar(
+        agg.rollup(['native', 'income']), x="native", y="count", color="income",
         barmode="group",
         color_discrete_map={'<=50K':'#3b82f6', '>50K':'#ef4444'},
         title="Income: US vs Non-US"
     )
-    fig_native.update_layout(template="plotly_white")
+    fig.update_layout(template="plotly_white")
+    return fig
 
-    # 7. Education Level vs Income (Box)
-    fig_edu_box = px.box(
-        data, x="income", y="education.num",
-        color='income',
+
+# 7. Education Level vs Income (Box)
+def fig_edu_box(agg):
+    fig = _box_figure(
+        agg, "education.num", "income",
         color_discrete_map={'<=50K':'#3b82f6', '>50K':'#10b981'},
         title="Education Level (Numeric) vs Income"
     )
-    fig_edu_box.update_layout(template="plotly_white")
+    fig.update_layout(template="plotly_white")
+    return fig
+
 
-    # 8. Income by Education Level
-    fig_edu_bar = px.histogram(
-        data, x="education_level", color="income",
+# 8. Income by Education Level
+def fig_edu_bar(agg):
+    fig = px.bar(
+        agg.rollup(['education_level', 'income']), x="education_level", y="count", color="income",
         barmode="group",
         color_discrete_map={'<=50K':'#3b82f6', '>50K':'#10b981'},
         title="Income by Education Level"
     )
-    fig_edu_bar.update_xaxes(tickangle=-45)
-    fig_edu_bar.update_layout(template="plotly_white")
-
-    # 9. Conditional Probability - Work Intensity
-    cond = (
-        data.groupby("work_intensity")["income"]
-        .apply(lambda x: (x == ">50K").mean())
-        .reset_index(name="prob_>50K")
-    )
-    fig_cond_prob = px.bar(
+    fig.update_xaxes(tickangle=-45)
+    fig.update_layout(template="plotly_white")
+    return fig
+
+
+# 9. Conditional Probability - Work Intensity
+def fig_cond_prob(agg):
+    cond = agg.rollup(['work_intensity']).rename(columns={'rate': 'prob_>50K'})
+    fig = px.bar(
         cond, x="work_intensity", y="prob_>50K",
         title="P(Income >50K | Work Intensity)",
-        color_discrete_sequence=['#f59e0b']
+        color_discrete_sequence=['#f59e0b'],
+        **_rate_error_bars(cond, 'prob_>50K')
     )
-    fig_cond_prob.update_layout(template="plotly_white")
+    fig.update_layout(template="plotly_white")
+    return fig
+
 
-    # 10. Income by Occupation
-    occupation_income = data.groupby(['occupation_grouped', 'income']).size().reset_index(name='count')
-    fig_occupation = px.bar(
+# 10. Income by Occupation
+def fig_occupation(agg):
+    occupation_income = agg.rollup(['occupation_grouped', 'income'])
+    fig = px.bar(
         occupation_income, x='occupation_grouped', y='count',
         color='income',
         barmode='group',
         color_discrete_map={'<=50K':'#ea580c', '>50K':'#fb923c'},
         title='Income Distribution by Occupation Group'
     )
-    fig_occupation.update_layout(template="plotly_white")
+    fig.update_layout(template="plotly_white")
+    return fig
 
-    # 11. Hours per Week by Occupation
-    fig_occupation_hours = px.box(
-        data, x='occupation_grouped', y='hours.per.week',
-        color='occupation_grouped',
+
+# 11. Hours per Week by Occupation
+def fig_occupation_hours(agg):
+    fig = _box_figure(
+        agg, 'hours.per.week', 'occupation_grouped',
         title='Hours per Week Distribution by Occupation'
     )
-    fig_occupation_hours.update_layout(template="plotly_white", showlegend=False)
+    fig.update_layout(template="plotly_white", showlegend=False)
+    return fig
+
 
-    # 12. Income by Workclass
-    workclass_income = pd.crosstab(data['workclass'], data['income']).reset_index()
-    workclass_income_melted = workclass_income.melt(id_vars='workclass', var_name='income', value_name='count')
-    fig_workclass = px.bar(
-        workclass_income_melted, x='workclass', y='count',
+# 12. Income by Workclass
+def fig_workclass(agg):
+    workclass_income = agg.rollup(['workclass', 'income'])
+    fig = px.bar(
+        workclass_income, x='workclass', y='count',
         color='income',
         barmode='group',
         color_discrete_map={'<=50K':'#3b82f6', '>50K':'#06b6d4'},
         title='Income Distribution by Workclass'
     )
-    fig_workclass.update_xaxes(tickangle=-45)
-    fig_workclass.update_layout(template="plotly_white")
+    fig.update_xaxes(tickangle=-45)
+    fig.update_layout(template="plotly_white")
+    return fig
 
-    # 13. Workclass Distribution
-    workclass_counts = data['workclass'].value_counts().reset_index()
-    workclass_counts.columns = ['workclass', 'count']
-    fig_workclass_dist = px.bar(
+
+# 13. Workclass Distribution
+def fig_workclass_dist(agg):
+    workclass_counts = agg.rollup(['workclass']).sort_values('count', ascending=False)
+    fig = px.bar(
         workclass_counts, y='workclass', x='count',
         orientation='h',
         color='workclass',
         title='Workclass Distribution'
     )
-    fig_workclass_dist.update_layout(template="plotly_white", showlegend=False)
+    fig.update_layout(template="plotly_white", showlegend=False)
+    return fig
 
-    # 14. Gender & Occupation High Earners
-    prop_df = (
-        data.groupby(['occupation_grouped', 'sex'])['income']
-        .apply(lambda x: (x == '>50K').mean())
-        .reset_index(name='prob_>50K')
-    )
-    fig_gender_occ = px.bar(
+
+# 14. Gender & Occupation High Earners
+def fig_gender_occ(agg):
+    prop_df = agg.rollup(['occupation_grouped', 'sex']).rename(columns={'rate': 'prob_>50K'})
+    fig = px.bar(
         prop_df, x='occupation_grouped', y='prob_>50K',
         color='sex',
         barmode='group',
         color_discrete_map={'Male':'#8b5cf6', 'Female':'#ec4899'},
-        title='Percentage of High Earners by Occupation and Sex'
+        title='Percentage of High Earners by Occupation and Sex',
+        **_rate_error_bars(prop_df, 'prob_>50K')
     )
-    fig_gender_occ.update_layout(template="plotly_white")
+    fig.update_layout(template="plotly_white")
+    return fig
 
-    # 15. Heatmap - Occupation vs Education
-    pivot_table = data.pivot_table(
+
+# 15. Heatmap - Occupation vs Education
+def fig_heatmap(agg):
+    rates = agg.rollup(['occupation_grouped', 'education_level'])
+    pivot_table = rates.pivot(
         index='occupation_grouped',
         columns='education_level',
-        values='income_numeric',
-        aggfunc='mean'
+        values='rate'
     )
-    fig_heatmap = px.imshow(
+    fig = px.imshow(
         pivot_table,
         text_auto=".2f",
         color_continuous_scale="YlGnBu",
         title="Probability of Income >50K (Occupation vs Education)"
     )
-    fig_heatmap.update_layout(template="plotly_white")
+    if 'rate_low' in rates:
+        # Confidence interval of each cell on hover
+        bounds = [
+            rates.pivot(index='occupation_grouped', columns='education_level', values=column)
+            .reindex(index=pivot_table.index, columns=pivot_table.columns)
+            for column in ('rate_low', 'rate_high')
+        ]
+        fig.update_traces(
+            customdata=np.dstack(bounds),
+            hovertemplate="%{y}, %{x}<br>P(>50K) = %{z:.2f} (95% CI %{customdata[0]:.2f}–%{customdata[1]:.2f})<extra></extra>"
+        )
+    fig.update_layout(template="plotly_white")
+    return fig
+
 
-    # 16. Income by Education & Occupation
-    edu_occ_income = data.groupby(['education_level', 'occupation_grouped'])['income_numeric'].mean().reset_index()
-    fig_edu_occ = px.bar(
+# 16. Income by Education & Occupation
+def fig_edu_occ(agg):
+    edu_occ_income = agg.rollup(['education_level', 'occupation_grouped']).rename(columns={'rate': 'income_numeric'})
+    fig = px.bar(
         edu_occ_income, x='education_level', y='income_numeric',
         color='occupation_grouped',
         barmode='group',
         title='Income Probability by Education and Occupation'
     )
-    fig_edu_occ.update_xaxes(tickangle=-45)
-    fig_edu_occ.update_layout(template="plotly_white")
+    fig.update_xaxes(tickangle=-45)
+    fig.update_layout(template="plotly_white")
+    return fig
+
 
-    # 17. Gender Gap by Education
-    gender_edu = data.groupby(['education_level', 'sex'])['income_numeric'].mean().reset_index()
-    fig_gender_gap = px.line(
+# 17. Gender Gap by Education
+def fig_gender_gap(agg):
+    gender_edu = agg.rollup(['education_level', 'sex']).rename(columns={'rate': 'income_numeric'})
+    fig = px.line(
         gender_edu, x='education_level', y='income_numeric',
         color='sex',
         markers=True,
         color_discrete_map={'Male':'#3b82f6', 'Female':'#ec4899'},
         title='Income Gap: Education Growth by Gender'
     )
-    fig_gender_gap.update_xaxes(tickangle=-45)
-    fig_gender_gap.update_layout(template="plotly_white")
-
-    # ==============================
-    # NEW VISUALIZATIONS
-    # ==============================
-
-    # 18. Work Intensity Pie Chart by Income
-    work_income_counts = (
-        data.groupby(["income", "work_intensity"])
-        .size()
-        .reset_index(name="count")
-    )
-    fig_work_pie = px.pie(
+    fig.update_xaxes(tickangle=-45)
+    fig.update_layout(template="plotly_white")
+    return fig
+
+
+# ==============================
+# NEW VISUALIZATIONS
+# ==============================
+
+# 18. Work Intensity Pie Chart by Income
+def fig_work_pie(agg):
+    work_income_counts = agg.rollup(["income", "work_intensity"])
+    fig = px.pie(
         work_income_counts,
         names="work_intensity",
         values="count",
@@ -208,15 +414,14 @@ def create_figures(data):
         title="Work Intensity Distribution by Income",
         color_discrete_sequence=px.colors.qualitative.Set3
     )
-    fig_work_pie.update_layout(template="plotly_white")
+    fig.update_layout(template="plotly_white")
+    return fig
 
-    # 19. Work Intensity + Sex Impact on Income
-    work_sex_income = (
-        data.groupby(["income", "work_intensity", "sex"])
-        .size()
-        .reset_index(name="count")
-    )
-    fig_work_sex = px.bar(
+
+# 19. Work Intensity + Sex Impact on Income
+def fig_work_sex(agg):
+    work_sex_income = agg.rollup(["income", "work_intensity", "sex"])
+    fig = px.bar(
         work_sex_income,
         x="work_intensity",
         y="count",
@@ -227,40 +432,45 @@ def create_figures(data):
         text_auto=True,
         color_discrete_sequence=px.colors.qualitative.Bold
     )
-    fig_work_sex.update_layout(template="plotly_white")
+    fig.update_layout(template="plotly_white")
+    return fig
+
 
-    # 20. Average Hours by Work Intensity
-    avg_hours = data.groupby("work_intensity")["hours.per.week"].mean().reset_index()
-    avg_hours.columns = ['work_intensity', 'avg_hours']
-    fig_avg_hours = px.bar(
+# 20. Average Hours by Work Intensity
+def fig_avg_hours(agg):
+    avg_hours = agg.rollup(["work_intensity"])
+    avg_hours['avg_hours'] = avg_hours['hours_sum'] / avg_hours['count']
+    fig = px.bar(
         avg_hours, x='work_intensity', y='avg_hours',
         title="Average Weekly Hours by Work Intensity",
         color_discrete_sequence=['#f59e0b'],
         text_auto='.1f'
     )
-    fig_avg_hours.update_layout(template="plotly_white")
+    fig.update_layout(template="plotly_white")
+    return fig
 
-    # 21. Income by Marital Status
-    marital_income = (
-        data.groupby(["marital_status", "income"])
-        .size()
-        .reset_index(name="count")
-    )
-    fig_marital = px.bar(
+
+# 21. Income by Marital Status
+def fig_marital(agg):
+    marital_income = agg.rollup(["marital_status", "income"])
+    fig = px.bar(
         marital_income, x='marital_status', y='count',
         color='income',
         barmode='stack',
         color_discrete_map={'<=50K':'#3b82f6', '>50K':'#10b981'},
         title="Income Distribution by Marital Status"
     )
-    fig_marital.update_xaxes(tickangle=-30)
-    fig_marital.update_layout(template="plotly_white")
+    fig.update_xaxes(tickangle=-30)
+    fig.update_layout(template="plotly_white")
+    return fig
+
 
-    # 22. Income Percentage by Relationship Group
+# 22. Income Percentage by Relationship Group
+def fig_relationship(agg):
     relationship_income = (
-        data.groupby(["relationship_group", "income"])
-        .size()
-        .unstack(fill_value=0)
+        agg.rollup(["relationship_group", "income"])
+        .pivot(index="relationship_group", columns="income", values="count")
+        .fillna(0)
     )
     relationship_pct = relationship_income.div(
         relationship_income.sum(axis=1), axis=0
@@ -270,7 +480,7 @@ def create_figures(data):
         var_name='income',
         value_name='percentage'
     )
-    fig_relationship = px.bar(
+    fig = px.bar(
         relationship_pct_reset, x='relationship_group', y='percentage',
         color='income',
         barmode='stack',
@@ -278,29 +488,167 @@ def create_figures(data):
         title="Income Percentage by Relationship Group",
         text_auto='.1f'
     )
-    fig_relationship.update_layout(template="plotly_white", yaxis_title="Percentage (%)")
-    all_figs = {
-            'fig_age': fig_age,
-            'fig_hours_income': fig_hours_income,
-            'fig_gender': fig_gender,
-            'fig_income_dist': fig_income_dist,
-            'fig_race': fig_race,
-            'fig_native': fig_native,
-            'fig_edu_box': fig_edu_box,
-            'fig_edu_bar': fig_edu_bar,
-            'fig_cond_prob': fig_cond_prob,
-            'fig_occupation': fig_occupation,
-            'fig_occupation_hours': fig_occupation_hours,
-            'fig_workclass': fig_workclass,
-            'fig_workclass_dist': fig_workclass_dist,
-            'fig_gender_occ': fig_gender_occ,
-            'fig_heatmap': fig_heatmap,
-            'fig_edu_occ': fig_edu_occ,
-            'fig_gender_gap': fig_gender_gap,
-            'fig_work_pie': fig_work_pie,
-            'fig_work_sex': fig_work_sex,
-            'fig_avg_hours': fig_avg_hours,
-            'fig_marital': fig_marital,
-            'fig_relationship': fig_relationship
-        }
-    return all_figs
\ No newline at end of file
+    fig.update_layout(template="plotly_white", yaxis_title="Percentage (%)")
+    return fig
+
+
+# ==============================
+# Figure Registry
+# ==============================
+
+FIGURE_BUILDERS = {
+    'fig_age': fig_age,
+    'fig_hours_income': fig_hours_income,
+    'fig_gender': fig_gender,
+    'fig_income_dist': fig_income_dist,
+    'fig_race': fig_race,
+    'fig_native': fig_native,
+    'fig_edu_box': fig_edu_box,
+    'fig_edu_bar': fig_edu_bar,
+    'fig_cond_prob': fig_cond_prob,
+    'fig_occupation': fig_occupation,
+    'fig_occupation_hours': fig_occupation_hours,
+    'fig_workclass': fig_workclass,
+    'fig_workclass_dist': fig_workclass_dist,
+    'fig_gender_occ': fig_gender_occ,
+    'fig_heatmap': fig_heatmap,
+    'fig_edu_occ': fig_edu_occ,
+    'fig_gender_gap': fig_gender_gap,
+    'fig_work_pie': fig_work_pie,
+    'fig_work_sex': fig_work_sex,
+    'fig_avg_hours': fig_avg_hours,
+    'fig_marital': fig_marital,
+    'fig_relationship': fig_relationship,
+}
+
+# Cube groupings each figure reads through Aggregates.rollup
+FIGURE_GROUPINGS = {
+    'fig_gender': [('sex', 'income')],
+    'fig_income_dist': [('income',)],
+    'fig_race': [('race', 'income')],
+    'fig_native': [('native', 'income')],
+    'fig_edu_bar': [('education_level', 'income')],
+    'fig_cond_prob': [('work_intensity',)],
+    'fig_occupation': [('occupation_grouped', 'income')],
+    'fig_workclass': [('workclass', 'income')],
+    'fig_workclass_dist': [('workclass',)],
+    'fig_gender_occ': [('occupation_grouped', 'sex')],
+    'fig_heatmap': [('occupation_grouped', 'education_level')],
+    'fig_edu_occ': [('education_level', 'occupation_grouped')],
+    'fig_gender_gap': [('education_level', 'sex')],
+    'fig_work_pie': [('income', 'work_intensity')],
+    'fig_work_sex': [('income', 'work_intensity', 'sex')],
+    'fig_avg_hours': [('work_intensity',)],
+    'fig_marital': [('marital_status', 'income')],
+    'fig_relationship': [('relationship_group', 'income')],
+}
+
+# Figures shown on each tab, in the order they are laid out
+TAB_FIGURES = {
+    'overview': ['fig_age', 'fig_income_dist', 'fig_hours_income', 'fig_gender'],
+    'demographics': ['fig_race', 'fig_native', 'fig_gender_occ'],
+    'work': ['fig_work_pie', 'fig_cond_prob', 'fig_avg_hours', 'fig_work_sex',
+             'fig_occupation', 'fig_occupation_hours', 'fig_workclass', 'fig_workclass_dist'],
+    'education': ['fig_edu_box', 'fig_edu_bar', 'fig_heatmap', 'fig_edu_occ', 'fig_gender_gap'],
+    'relationships': ['fig_marital', 'fig_relationship'],
+}
+
+
+def fallback_figure(message="This chart could not be generated."):
+    fig = go.Figure()
+    fig.add_annotation(text=message, x=0.5, y=0.5, xref='paper', yref='paper',
+                       showarrow=False, font=dict(size=16, color='#6b7280'))
+    fig.update_layout(template="plotly_white", xaxis_visible=False, yaxis_visible=False)
+    return fig
+
+
+def _build_figure(agg, name, serialize):
+    # Runs in the figure pool; returns the figure (or its JSON) and the
+    # seconds spent building and serializing it
+    start = time.perf_counter()
+    fig = FIGURE_BUILDERS[name](agg)
+    built = time.perf_counter()
+    if serialize:
+        fig = figure_to_json(fig)
+    return fig, built - start, time.perf_counter() - built
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _figure_executor():
+    global _executor
+    if FIGURE_WORKERS <= 1:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            if FIGURE_POOL == 'process':
+                # Not forked from a server process running request threads,
+                # whose held locks a forked child could inherit
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                _executor = ProcessPoolExecutor(max_workers=FIGURE_WORKERS, mp_context=context)
+            else:
+                _executor = ThreadPoolExecutor(max_workers=FIGURE_WORKERS)
+        return _executor
+
+
+def _reset_executor(executor):
+    # Drop a pool whose worker process died; the next request starts a new one
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_figures(data, names=None, serialize=False, on_error=None):
+    # Build only the requested figures (all of them by default) from an
+    # AggregateCube; a plain DataFrame is aggregated first. With `serialize`
+    # the figures come back as JSON strings. A builder that raises or times
+    # out gets fallback_figure(), and on_error(name, exc) is called.
+    if not isinstance(data, AggregateCube):
+        data = build_cube(data)
+    if names is None:
+        names = FIGURE_BUILDERS
+    with span('aggregate'):
+        agg = Aggregates(data, names)
+
+    results, errors = {}, {}
+    executor = _figure_executor()
+    if executor is None:
+        for name in names:
+            try:
+                results[name] = _build_figure(agg, name, serialize)
+            except Exception as exc:
+                errors[name] = exc
+    else:
+        task_agg = agg.compact() if FIGURE_POOL == 'process' else agg
+        futures = {executor.submit(_build_figure, task_agg, name, serialize): name for name in names}
+        done, pending = wait(futures, timeout=FIGURE_TIMEOUT)
+        for future in pending:
+            future.cancel()
+            errors[futures[future]] = TimeoutError(f"not built within {FIGURE_TIMEOUT}s")
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except Exception as exc:
+                errors[futures[future]] = exc
+                if isinstance(exc, BrokenExecutor):
+                    _reset_executor(executor)
+
+    figs = {}
+    for name in names:
+        if name in errors:
+            logger.error("Building %s failed: %r", name, errors[name])
+            if on_error is not None:
+                on_error(name, errors[name])
+            fig = fallback_figure()
+            figs[name] = figure_to_json(fig) if serialize else fig
+            continue
+        figs[name], build_seconds, serialize_seconds = results[name]
+        observe('dashboard_span_seconds', build_seconds, span='figure', figure=name)
+        if serialize:
+            observe('dashboard_span_seconds', serialize_seconds, span='serialize', figure=name)
+    return figs
@@ -1,92 +1,751 @@
 import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
 import kagglehub
 
-def get_cleaned_data():
-    # Load Dataset
+try:
+    import fcntl
+except ImportError:  # Windows: snapshot builds are not coordinated between processes
+    fcntl = None
+
+# Bump whenever the cleaning / feature engineering below changes, so stale
+# snapshots are rebuilt instead of being served
+PIPELINE_VERSION = 2
+DEFAULT_SNAPSHOT = os.path.join(".cache", "adult_census.feather")
+
+AGE_BINS = [16, 25, 45, 65, 90]
+AGE_LABELS = ["Young", "Adult", "Middle-Aged", "Senior"]
+WORK_INTENSITY_BINS = [0, 35, 45, 100]
+WORK_INTENSITY_LABELS = ["Part-Time", "Full-Time", "Over-Time"]
+
+# Low-cardinality columns every figure groups by
+CUBE_DIMENSIONS = [
+    "age_range", "income", "sex", "race", "education_level", "occupation_grouped",
+    "workclass", "work_intensity", "marital_status", "relationship_group", "native",
+]
+
+# Per-combination sums kept by the cube
+CUBE_MEASURES = ["count", "high_earners", "age_sum", "hours_sum"]
+# Extra measure of cubes built from a weighted sample: rows actually drawn
+SAMPLE_COLUMN = "sampled"
+
+# Numeric columns drawn as distributions (box plots / histograms),
+# stored as value counts per age_range plus the listed dimensions
+CUBE_DISTRIBUTIONS = {
+    "age": [],
+    "hours.per.week": ["income", "occupation_grouped"],
+    "education.num": ["income"],
+}
+
+def find_source_csv(csv_path=None):
+    # A local CSV (argument or CENSUS_CSV) wins over the Kaggle download
+    csv_path = csv_path or os.environ.get("CENSUS_CSV")
+    if csv_path:
+        return csv_path
     path = kagglehub.dataset_download("uciml/adult-census-income")
     files = os.listdir(path)
     csv_file = [f for f in files if f.endswith(".csv")][0]
-    df = pd.read_csv(os.path.join(path, csv_file))
-
-    # Data Cleaning
-    df = df.replace("?", "Unknown")
-    data = df.copy()
-
-    # Feature Engineering (Helper Functions)
-    def group_education(level):
-        if level in ['Preschool','1st-4th','5th-6th','7th-8th','9th','10th','11th','12th']:
-            return 'Pre-Secondary'
-        elif level == 'HS-grad':
-            return 'Secondary-Grad'
-        elif level in ['Some-college','Assoc-acdm','Assoc-voc']:
-            return 'Higher-Ed'
-        elif level == 'Bachelors':
-            return 'Bachelors'
-        elif level in ['Masters','Prof-school','Doctorate']:
-            return 'Post-Grad'
-        return 'Other'
-
-    data["education_level"] = data["education"].apply(group_education)
+    return os.path.join(path, csv_file)
+
+
+def get_cleaned_data(csv_path=None):
+    # Load Dataset
+    df = pd.read_csv(find_source_csv(csv_path))
+    return compact_data(clean_data(df))
+
+
+def _group_levels(groups):
+    # {group: [levels]} -> {level: group}
+    return {level: group for group, levels in groups.items() for level in levels}
+
+
+EDUCATION_GROUPS = _group_levels({
+    'Pre-Secondary': ['Preschool','1st-4th','5th-6th','7th-8th','9th','10th','11th','12th'],
+    'Secondary-Grad': ['HS-grad'],
+    'Higher-Ed': ['Some-college','Assoc-acdm','Assoc-voc'],
+    'Bachelors': ['Bachelors'],
+    'Post-Grad': ['Masters','Prof-school','Doctorate'],
+})
+
+OCCUPATION_GROUPS = _group_levels({
+    'White-Collar': ['Exec-managerial','Prof-specialty'],
+    'Blue-Collar': ['Craft-repair','Farming-fishing','Machine-op-inspct','Transport-moving','Handlers-cleaners'],
+    'Service': ['Sales','Tech-support','Protective-serv','Priv-house-serv','Other-service'],
+})
+
+MARITAL_GROUPS = {
+    "Married-civ-spouse":"Married",
+    "Married-AF-spouse":"Married",
+    "Divorced":"Previously-Married",
+    "Separated":"Previously-Married",
+    "Widowed":"Previously-Married",
+    "Married-spouse-absent":"Previously-Married",
+    "Never-married":"Single"
+}
+
+RELATIONSHIP_GROUPS = {
+    "Husband": "In-Relationship",
+    "Wife": "In-Relationship",
+    "Own-child": "Family",
+    "Not-in-family": "Independent",
+    "Other-relative": "Family",
+    "Unmarried": "Independent"
+}
+
+RACE_GROUPS = {
+    "Amer-Indian-Eskimo": "Other",
+    "Asian-Pac-Islander": "Asian"
+}
+
+# Marks a lookup that keeps unmapped values unchanged (like Series.replace)
+_KEEP = object()
+
+
+def _lookup(column, table, default=_KEEP):
+    # Map each distinct value once, then broadcast through the factorized
+    # codes; missing values (code -1) pick the trailing fallback entry.
+    # A column read_csv() found empty is float64 and cannot hold `default`,
+    # so the result's dtype is then inferred (as Series.apply does).
+    codes, uniques = pd.factorize(column)
+    keep = default is _KEEP
+    mapped = [table.get(value, value if keep else default) for value in uniques]
+    mapped.append(getattr(column.dtype, "na_value", np.nan) if keep else default)
+    if keep or not pd.api.types.is_numeric_dtype(column):
+        mapped = pd.array(mapped, dtype=column.dtype)
+    else:
+        mapped = pd.Series(mapped).array
+    return pd.Series(mapped[codes], index=column.index)
+
+
+def clean_data(df):
+    # Data Cleaning (string columns only; numeric columns cannot hold "?")
+    data = df.copy(deep=False)
+    for col in data.select_dtypes(exclude="number").columns:
+        data[col] = _lookup(data[col], {"?": "Unknown"})
+
+    # Feature Engineering (table-driven lookups)
+    data["education_level"] = _lookup(data["education"], EDUCATION_GROUPS, "Other")
 
     # ---- Age Range ----
     data["age_range"] = pd.cut(
         data["age"],
-        bins=[16,25,45,65,90],
-        labels=["Young","Adult","Middle-Aged","Senior"]
+        bins=AGE_BINS,
+        labels=AGE_LABELS
     )
 
     # ---- Work Intensity ----
     data["work_intensity"] = pd.cut(
         data["hours.per.week"],
-        bins=[0,35,45,100],
-        labels=["Part-Time","Full-Time","Over-Time"]
+        bins=WORK_INTENSITY_BINS,
+        labels=WORK_INTENSITY_LABELS
     )
 
     # ---- Native Country ----
-    data["native"] = data["native.country"].apply(
-        lambda x: "US" if x == "United-States" else "Non-US"
-    )
+    data["native"] = _lookup(data["native.country"], {"United-States": "US"}, "Non-US")
 
     # ---- Marital Status ----
-    data["marital_status"] = data["marital.status"].replace({
-        "Married-civ-spouse":"Married",
-        "Married-AF-spouse":"Married",
-        "Divorced":"Previously-Married",
-        "Separated":"Previously-Married",
-        "Widowed":"Previously-Married",
-        "Married-spouse-absent":"Previously-Married",
-        "Never-married":"Single"
-    })
+    data["marital_status"] = _lookup(data["marital.status"], MARITAL_GROUPS)
 
     # ---- Occupation Grouping ----
-    def group_occupation(occ):
-        if occ in ['Exec-managerial','Prof-specialty']:
-            return 'White-Collar'
-        elif occ in ['Craft-repair','Farming-fishing','Machine-op-inspct','Transport-moving','Handlers-cleaners']:
-            return 'Blue-Collar'
-        elif occ in ['Sales','Tech-support','Protective-serv','Priv-house-serv','Other-service']:
-            return 'Service'
-        return 'Unknown'
-
-    data["occupation_grouped"] = data["occupation"].apply(group_occupation)
+    data["occupation_grouped"] = _lookup(data["occupation"], OCCUPATION_GROUPS, "Unknown")
 
     # ---- Relationship Grouping ----
-    data["relationship_group"] = data["relationship"].replace({
-        "Husband": "In-Relationship",
-        "Wife": "In-Relationship",
-        "Own-child": "Family",
-        "Not-in-family": "Independent",
-        "Other-relative": "Family",
-        "Unmarried": "Independent"
-    })
+    data["relationship_group"] = _lookup(data["relationship"], RELATIONSHIP_GROUPS)
 
     # ---- Income Numeric ----
-    data["income_numeric"] = data["income"].apply(lambda x: 1 if x == ">50K" else 0)
+    data["income_numeric"] = (data["income"] == ">50K").astype("int64")
 
     # ---- Race Grouping ----
-    data["race"] = data["race"].replace({
-        "Amer-Indian-Eskimo": "Other",
-        "Asian-Pac-Islander": "Asian"
-    })
-    return data
\ No newline at end of file
+    data["race"] = _lookup(data["race"], RACE_GROUPS)
+    return data
+
+
+# ==============================
+# Compact Representation
+# ==============================
+# Category orders used for every categorical column (and so for chart axes);
+# values not listed here are appended after them in sorted order
+CATEGORY_ORDERS = {
+    "income": ["<=50K", ">50K"],
+    "sex": ["Male", "Female"],
+    "race": ["White", "Black", "Asian", "Other"],
+    "education_level": [*dict.fromkeys(EDUCATION_GROUPS.values()), "Other"],
+    "occupation_grouped": [*dict.fromkeys(OCCUPATION_GROUPS.values()), "Unknown"],
+    "workclass": [],
+    "marital_status": [*dict.fromkeys(MARITAL_GROUPS.values())],
+    "relationship_group": [*dict.fromkeys(RELATIONSHIP_GROUPS.values())],
+    "native": ["US", "Non-US"],
+}
+
+# Columns the figures and KPIs read; everything else is dropped
+NUMERIC_COLUMNS = ["age", "education.num", "hours.per.week", "income_numeric"]
+KEPT_COLUMNS = [*NUMERIC_COLUMNS, *CATEGORY_ORDERS, "age_range", "work_intensity"]
+
+
+def _as_category(column, order):
+    # Factorize once and remap the codes; much faster than astype("category")
+    # on string columns
+    codes, uniques = pd.factorize(column)
+    categories = [*order, *sorted(set(uniques) - set(order))]
+    position = {value: i for i, value in enumerate(categories)}
+    remap = np.array([position[value] for value in uniques] + [-1])
+    return pd.Series(
+        pd.Categorical.from_codes(remap[codes], dtype=pd.CategoricalDtype(categories)),
+        index=column.index, name=column.name,
+    )
+
+
+def compact_data(data):
+    # Drop unused raw columns, store strings as categoricals with fixed
+    # orders and downcast the integer columns
+    data = data[KEPT_COLUMNS].copy()
+    for col, order in CATEGORY_ORDERS.items():
+        data[col] = _as_category(data[col], order)
+    for col in NUMERIC_COLUMNS:
+        data[col] = pd.to_numeric(data[col], downcast="integer")
+    return data
+
+
+def _categorize(frame):
+    # Re-apply CATEGORY_ORDERS, e.g. after concatenating frames whose
+    # categoricals were built from different batches
+    frame = frame.copy()
+    for col, order in CATEGORY_ORDERS.items():
+        if col in frame:
+            frame[col] = _as_category(frame[col], order)
+    return frame
+
+
+def memory_report(before, after):
+    # Per-column deep memory use (bytes) of two versions of the frame
+    report = pd.DataFrame({
+        "before": before.memory_usage(index=False, deep=True),
+        "after": after.memory_usage(index=False, deep=True),
+    }).fillna(0).astype("int64")
+    report.loc["total"] = report.sum()
+    return report
+
+
+# ==============================
+# Local Snapshot
+# ==============================
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_stamp(snapshot_path):
+    try:
+        with open(snapshot_path + ".json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def snapshot_path_from_env(snapshot_path=None):
+    return snapshot_path or os.environ.get("CENSUS_SNAPSHOT", DEFAULT_SNAPSHOT)
+
+
+def write_snapshot(data, snapshot_path, source_sha256, previous=None):
+    # Uncompressed Arrow IPC so readers can memory-map it; written to a temp
+    # file first so a concurrent reader never sees a half-written snapshot.
+    # `previous` is the stamp of the snapshot that `data` extends with the
+    # rows of source_sha256: the version then chains onto it, and the
+    # history records how many rows each earlier version had.
+    # Written as a single record batch so every column is one contiguous
+    # buffer that map_snapshot() can view without copying.
+    os.makedirs(os.path.dirname(snapshot_path) or ".", exist_ok=True)
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    table = pa.Table.from_pandas(data, preserve_index=False).combine_chunks()
+    feather.write_feather(table, tmp_path, compression="uncompressed", chunksize=max(len(data), 1))
+    os.replace(tmp_path, snapshot_path)
+
+    if previous is None:
+        stamp = {
+            "source_sha256": source_sha256,
+            "pipeline_version": PIPELINE_VERSION,
+            "rows": len(data),
+            "version": hashlib.sha1(f"{source_sha256}:{PIPELINE_VERSION}".encode()).hexdigest()[:12],
+            "appended": [],
+            "history": [],
+        }
+    else:
+        stamp = {
+            **previous,
+            "rows": len(data),
+            "version": hashlib.sha1(f"{previous['version']}:{source_sha256}".encode()).hexdigest()[:12],
+            "appended": [*previous.get("appended", []), source_sha256],
+            "history": [*previous.get("history", []), {"version": previous["version"], "rows": previous["rows"]}],
+        }
+    with open(snapshot_path + ".json.tmp", "w") as f:
+        json.dump(stamp, f, indent=2)
+    os.replace(snapshot_path + ".json.tmp", snapshot_path + ".json")
+    return stamp
+
+
+@contextmanager
+def snapshot_lock(snapshot_path):
+    # Exclusive lock shared by every process using this snapshot, held while
+    # it is built, appended to or published
+    os.makedirs(os.path.dirname(snapshot_path) or ".", exist_ok=True)
+    with open(snapshot_path + ".lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _column_view(array):
+    # pandas column backed by the Arrow buffers of `array`, or None when it
+    # cannot be viewed in place (nulls, non-numeric values)
+    if array.null_count:
+        return None
+    if pa.types.is_dictionary(array.type):
+        indices = array.indices
+        codes = np.frombuffer(
+            indices.buffers()[1], dtype=indices.type.to_pandas_dtype(),
+            count=len(indices), offset=indices.offset * indices.type.bit_width // 8,
+        )
+        dtype = pd.CategoricalDtype(array.dictionary.to_pandas(), ordered=array.type.ordered)
+        return pd.Categorical.from_codes(codes, dtype=dtype, validate=False)
+    if pa.types.is_integer(array.type) or pa.types.is_floating(array.type):
+        return array.to_numpy(zero_copy_only=True)
+    return None
+
+
+def map_snapshot(snapshot_path, start=0):
+    # Rows from `start` on as a read-only frame over the memory-mapped
+    # snapshot. The pages live in the OS page cache, so every process mapping
+    # the same file shares one copy instead of holding a private frame.
+    # Columns that cannot be viewed in place are converted as usual.
+    table = feather.read_table(snapshot_path, memory_map=True).slice(start)
+    columns = {}
+    for name in table.column_names:
+        column = table.column(name)
+        view = _column_view(column.chunk(0)) if column.num_chunks == 1 else None
+        columns[name] = view if view is not None else column.to_pandas()
+    return pd.DataFrame(columns, copy=False)
+
+
+def load_cleaned_data(csv_path=None, snapshot_path=None, rebuild=False):
+    # Serve the cleaned frame from the local snapshot when it matches the
+    # source file and PIPELINE_VERSION; otherwise run the pipeline and store it.
+    # Without an explicit CSV an existing snapshot is trusted as is, so hosts
+    # without network access never call kagglehub. Builds hold snapshot_lock,
+    # so processes starting together run the pipeline once and the others
+    # map its result.
+    # Returns (data, version).
+    csv_path = csv_path or os.environ.get("CENSUS_CSV")
+    snapshot_path = snapshot_path_from_env(snapshot_path)
+    rebuild = rebuild or os.environ.get("CENSUS_REBUILD") == "1"
+    source_sha256 = file_sha256(csv_path) if csv_path else None
+
+    def is_current(stamp):
+        return (
+            stamp is not None
+            and stamp["pipeline_version"] == PIPELINE_VERSION
+            and os.path.exists(snapshot_path)
+            and (source_sha256 is None or stamp["source_sha256"] == source_sha256)
+        )
+
+    stamp = read_stamp(snapshot_path)
+    if not rebuild and is_current(stamp):
+        return map_snapshot(snapshot_path), stamp["version"]
+
+    with snapshot_lock(snapshot_path):
+        # Another process may have (re)built it while we waited for the lock
+        latest = read_stamp(snapshot_path)
+        if is_current(latest) and (not rebuild or latest != stamp):
+            return map_snapshot(snapshot_path), latest["version"]
+
+        csv_path = find_source_csv(csv_path)
+        data = get_cleaned_data(csv_path)
+        stamp = write_snapshot(data, snapshot_path, source_sha256 or file_sha256(csv_path))
+    return data, stamp["version"]
+
+
+# ==============================
+# Incremental Append
+# ==============================
+def append_data(data, batch):
+    # Rows of `batch` after those of `data`, with the categories and dtypes a
+    # single compact_data() run over both would have produced
+    return _categorize(pd.concat([data, batch], ignore_index=True))
+
+
+def append_records(csv_path, snapshot_path=None):
+    # Engineer only the new batch and append it to the snapshot as a new
+    # version. A batch whose file was already appended is skipped. The new
+    # version's cube is the published cube plus the batch's, so processes
+    # starting later read it instead of aggregating every row again.
+    snapshot_path = snapshot_path_from_env(snapshot_path)
+    batch_sha256 = file_sha256(csv_path)
+    batch = compact_data(clean_data(pd.read_csv(csv_path)))
+    with snapshot_lock(snapshot_path):
+        stamp = read_stamp(snapshot_path)
+        if stamp is None or stamp["pipeline_version"] != PIPELINE_VERSION:
+            raise ValueError(f"No current snapshot at {snapshot_path}; build one before appending")
+        if batch_sha256 in stamp.get("appended", []):
+            return stamp
+        data = append_data(map_snapshot(snapshot_path), batch)
+        cube = read_cube(snapshot_path, stamp["version"])
+        stamp = write_snapshot(data, snapshot_path, batch_sha256, previous=stamp)
+        if cube is not None:
+            write_cube(merge_cubes([cube, build_cube(batch)]), snapshot_path, stamp["version"])
+        return stamp
+
+
+# ==============================
+# Aggregate Cube
+# ==============================
+# Counts and sums per combination of CUBE_DIMENSIONS, plus value counts for
+# the CUBE_DISTRIBUTIONS columns. Built once after get_cleaned_data(); an age
+# selection only filters these small tables, independent of the row count.
+class AggregateCube:
+    def __init__(self, counts, distributions):
+        self.counts = counts
+        self.distributions = distributions
+
+    @property
+    def measures(self):
+        return [*CUBE_MEASURES, SAMPLE_COLUMN] if SAMPLE_COLUMN in self.counts else CUBE_MEASURES
+
+    def matching(self, age_ranges=None, filters=None):
+        # Boolean mask over `counts` for an age selection and {column: values}
+        # filters on other dimensions; an empty value list does not filter
+        mask = np.ones(len(self.counts), dtype=bool)
+        if age_ranges is not None:
+            mask &= self.counts["age_range"].isin(age_ranges).to_numpy()
+        for column, values in (filters or {}).items():
+            if values:
+                mask &= self.counts[column].isin(values).to_numpy()
+        return mask
+
+    def totals(self, age_ranges=None, filters=None):
+        return self.counts[self.matching(age_ranges, filters)][CUBE_MEASURES].sum()
+
+    def totals_by_age(self, filters=None):
+        counts = self.counts[self.matching(None, filters)]
+        return counts.groupby("age_range", observed=True)[CUBE_MEASURES].sum()
+
+    def select(self, age_ranges):
+        counts = self.counts[self.counts["age_range"].isin(age_ranges)]
+        distributions = {
+            column: dist[dist["age_range"].isin(age_ranges)]
+            for column, dist in self.distributions.items()
+        }
+        return AggregateCube(counts, distributions)
+
+    def rollup(self, keys):
+        return (
+            self.counts.groupby(keys, observed=True, sort=True)
+            [self.measures]
+            .sum()
+            .reset_index()
+        )
+
+    def distribution(self, column, keys=()):
+        dist = self.distributions[column]
+        return (
+            dist.groupby([*keys, column], observed=True, sort=True)["count"]
+            .sum()
+            .reset_index()
+        )
+
+    @property
+    def n_rows(self):
+        return int(round(self.counts["count"].sum()))
+
+
+def build_cube(data, weight=None):
+    # With `weight`, the name of a per-row weight column (a stratified
+    # sample), measures and value counts are float weighted sums, and
+    # SAMPLE_COLUMN keeps the number of rows drawn per combination. Most
+    # combinations hold a few sampled rows, so rounding them here would bias
+    # every total the same way; the figures round after summing instead.
+    if weight is not None:
+        w = data[weight]
+        counts = (
+            data[CUBE_DIMENSIONS]
+            .assign(
+                count=w,
+                high_earners=data["income_numeric"] * w,
+                age_sum=data["age"] * w,
+                hours_sum=data["hours.per.week"] * w,
+                **{SAMPLE_COLUMN: 1},
+            )
+            .groupby(CUBE_DIMENSIONS, observed=True, dropna=False)
+            [[*CUBE_MEASURES, SAMPLE_COLUMN]]
+            .sum()
+            .reset_index()
+        )
+        return AggregateCube(counts, build_distributions(data, weight))
+
+    counts = (
+        data.groupby(CUBE_DIMENSIONS, observed=True, dropna=False)
+        .agg(
+            count=("income_numeric", "size"),
+            high_earners=("income_numeric", "sum"),
+            age_sum=("age", "sum"),
+            hours_sum=("hours.per.week", "sum"),
+        )
+        .astype("int64")
+        .reset_index()
+    )
+    return AggregateCube(counts, build_distributions(data))
+
+
+def build_distributions(data, weight=None):
+    distributions = {}
+    for column, keys in CUBE_DISTRIBUTIONS.items():
+        groups = data.groupby(["age_range", *keys, column], observed=True, dropna=False)
+        if weight is None:
+            distributions[column] = groups.size().reset_index(name="count")
+        else:
+            distributions[column] = groups[weight].sum().reset_index(name="count")
+    return distributions
+
+
+def merge_cubes(cubes):
+    # Sum cubes built from disjoint batches of rows into one cube
+    counts = _categorize(pd.concat([cube.counts for cube in cubes], ignore_index=True))
+    counts = (
+        counts.groupby(CUBE_DIMENSIONS, observed=True, dropna=False)[cubes[0].measures]
+        .sum()
+        .reset_index()
+    )
+    distributions = {}
+    for column, keys in CUBE_DISTRIBUTIONS.items():
+        dist = _categorize(pd.concat([cube.distributions[column] for cube in cubes], ignore_index=True))
+        distributions[column] = (
+            dist.groupby(["age_range", *keys, column], observed=True, dropna=False)["count"]
+            .sum()
+            .reset_index()
+        )
+    return AggregateCube(counts, distributions)
+
+
+# ==============================
+# Stratified Sample
+# ==============================
+# Approximate mode: figures are computed from a sample drawn separately
+# from every (age_range, income) stratum and weighted back to the stratum
+# sizes. The weights of a stratum sum to its size, so the per-age totals and
+# income split of the weighted cube match the full data; every finer count is
+# an estimate.
+SAMPLE_STRATA = ["age_range", "income"]
+MIN_STRATUM_ROWS = 500
+
+
+def stratified_sample(data, fraction, seed=0):
+    # `fraction` of every stratum, but at least MIN_STRATUM_ROWS of it, drawn
+    # without replacement. The "weight" column holds stratum size / rows drawn.
+    rng = np.random.default_rng(seed)
+    strata = data.groupby(SAMPLE_STRATA, observed=True, dropna=False).ngroup().to_numpy()
+    sizes = np.bincount(strata)
+    take = np.minimum(sizes, np.maximum(np.ceil(sizes * fraction), MIN_STRATUM_ROWS)).astype("int64")
+
+    # Random rank of each row within its stratum
+    order = np.lexsort((rng.random(len(data)), strata))
+    rank = np.empty(len(data), dtype="int64")
+    rank[order] = np.arange(len(data)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    keep = np.flatnonzero(rank < take[strata])
+
+    sample = data.take(keep).reset_index(drop=True)
+    sample["weight"] = (sizes / take)[strata[keep]]
+    return sample
+
+
+def sample_fraction_for_budget(data, budget_seconds, probe_rows=200_000):
+    # Fraction whose sample re-aggregates (as a filtered request does) in
+    # about `budget_seconds`, timed on the first rows of `data`
+    probe = data.iloc[:probe_rows]
+    start = time.perf_counter()
+    build_distributions(probe)
+    rows_per_second = len(probe) / max(time.perf_counter() - start, 1e-6)
+    return min(1.0, budget_seconds * rows_per_second / max(len(data), 1))
+
+
+# ==============================
+# Shared Dataset
+# ==============================
+# Multi-process servers (gunicorn workers) call publish_dataset(): the first
+# process builds the snapshot and its cube, the others wait on snapshot_lock
+# and then map the snapshot and read the cube instead of repeating the work.
+def cube_dir(snapshot_path, version):
+    return os.path.join(snapshot_path + ".cube", version)
+
+
+def write_cube(cube, snapshot_path, version):
+    # One uncompressed Arrow file per cube table, in a directory per version;
+    # cubes of older versions are removed
+    root = snapshot_path + ".cube"
+    tmp_dir = os.path.join(root, f"{version}.{os.getpid()}.tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    feather.write_feather(cube.counts, os.path.join(tmp_dir, "counts.feather"), compression="uncompressed")
+    for column, dist in cube.distributions.items():
+        feather.write_feather(dist, os.path.join(tmp_dir, f"dist-{column}.feather"), compression="uncompressed")
+    for entry in os.listdir(root):
+        if entry != os.path.basename(tmp_dir):
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+    os.replace(tmp_dir, cube_dir(snapshot_path, version))
+
+
+def read_cube(snapshot_path, version):
+    # The published cube of `version`, or None if there is none
+    path = cube_dir(snapshot_path, version)
+    try:
+        counts = feather.read_feather(os.path.join(path, "counts.feather"))
+        distributions = {
+            column: feather.read_feather(os.path.join(path, f"dist-{column}.feather"))
+            for column in CUBE_DISTRIBUTIONS
+        }
+    except OSError:
+        return None
+    return AggregateCube(counts, distributions)
+
+
+def parquet_path(snapshot_path, version):
+    return os.path.join(snapshot_path + ".parquet", f"{version}.parquet")
+
+
+def export_parquet(snapshot_path, version):
+    # Parquet copy of snapshot `version` for engines that query Parquet
+    # files (query_backend.DuckDBBackend). The copy of the version before it
+    # is kept, since states still serving it re-open it on every query;
+    # older copies are removed. Returns its path.
+    path = parquet_path(snapshot_path, version)
+    with snapshot_lock(snapshot_path):
+        if os.path.exists(path):
+            return path
+        if read_stamp(snapshot_path)["version"] != version:
+            raise RuntimeError(f"snapshot {snapshot_path} is no longer version {version}")
+        root = os.path.dirname(path)
+        os.makedirs(root, exist_ok=True)
+        # The most recently written copy is the previous version's, whether
+        # it was appended to or rebuilt
+        older = sorted(
+            (entry for entry in os.listdir(root) if entry.endswith(".parquet")),
+            key=lambda entry: os.path.getmtime(os.path.join(root, entry)),
+        )
+        for entry in older[:-1]:
+            os.remove(os.path.join(root, entry))
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        pq.write_table(feather.read_table(snapshot_path, memory_map=True), tmp_path)
+        os.replace(tmp_path, path)
+    return path
+
+
+def publish_dataset(csv_path=None, snapshot_path=None, rebuild=False):
+    # Make sure the snapshot and its cube exist, then attach to them.
+    # Returns (data, cube, version); `data` is a read-only map_snapshot() frame.
+    snapshot_path = snapshot_path_from_env(snapshot_path)
+    load_cleaned_data(csv_path, snapshot_path, rebuild)
+    with snapshot_lock(snapshot_path):
+        version = read_stamp(snapshot_path)["version"]
+        data = map_snapshot(snapshot_path)
+        cube = read_cube(snapshot_path, version)
+        if cube is None:
+            cube = build_cube(data)
+            write_cube(cube, snapshot_path, version)
+    return data, cube, version
+
+
+# ==============================
+# Streaming Ingest
+# ==============================
+PARTITION_COLUMN = "age_range"
+
+
+def stream_ingest(csv_path, out_dir, chunksize=250_000):
+    # Run the same cleaning / feature engineering over bounded batches of the
+    # CSV, appending each batch to a Parquet dataset partitioned by age_range
+    # and folding it into the aggregate cube. Memory stays proportional to
+    # chunksize plus the cube, not to the size of the file. Returns the cube.
+    tmp_dir = f"{out_dir.rstrip(os.sep)}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    cubes, offset = [], 0
+    for i, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunksize)):
+        engineered = clean_data(chunk)[KEPT_COLUMNS]
+        # Plain strings / int64 on disk so every batch has the same schema;
+        # read_partitioned() applies compact_data() to the whole dataset
+        batch = engineered.assign(row_id=pd.RangeIndex(offset, offset + len(chunk)))
+        offset += len(chunk)
+        for col in CATEGORY_ORDERS:
+            batch[col] = batch[col].astype(object)
+        pq.write_to_dataset(
+            pa.Table.from_pandas(batch, preserve_index=False), tmp_dir,
+            partition_cols=[PARTITION_COLUMN], basename_template=f"batch-{i:05d}-{{i}}.parquet",
+        )
+
+        # Batch cubes are folded together a few at a time to bound memory
+        cubes.append(build_cube(compact_data(engineered)))
+        if len(cubes) >= 8:
+            cubes = [merge_cubes(cubes)]
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return merge_cubes(cubes)
+
+
+def read_partitioned(out_dir, age_ranges=None):
+    # Load a stream_ingest() dataset (optionally only some age_range
+    # partitions) back into the same frame get_cleaned_data() returns
+    filters = [(PARTITION_COLUMN, "in", list(age_ranges))] if age_ranges is not None else None
+    # The partition key is read as plain strings: rows whose age falls
+    # outside AGE_BINS sit in the null (__HIVE_DEFAULT_PARTITION__)
+    # partition, which Arrow cannot unify with dictionary-encoded keys
+    partitioning = ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor="hive")
+    data = pq.read_table(out_dir, filters=filters, partitioning=partitioning).to_pandas()
+    data[PARTITION_COLUMN] = data[PARTITION_COLUMN].astype(object).astype(
+        pd.CategoricalDtype(AGE_LABELS, ordered=True)
+    )
+    data = data.sort_values("row_id").reset_index(drop=True)
+    return compact_data(data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the local snapshot of the cleaned census data.")
+    parser.add_argument("--csv", help="local source CSV (default: CENSUS_CSV or the Kaggle download)")
+    parser.add_argument("--snapshot", help=f"snapshot path (default: CENSUS_SNAPSHOT or {DEFAULT_SNAPSHOT})")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild even if the snapshot is current")
+    parser.add_argument("--memory-report", action="store_true",
+                        help="print the in-memory footprint before/after compact_data and exit")
+    parser.add_argument("--stream-to", metavar="DIR",
+                        help="ingest the CSV in batches into a Parquet dataset partitioned by age_range and exit")
+    parser.add_argument("--chunksize", type=int, default=250_000, help="rows per batch for --stream-to")
+    parser.add_argument("--append", metavar="CSV",
+                        help="append a new batch of records to the existing snapshot and exit")
+    args = parser.parse_args()
+
+    if args.append:
+        stamp = append_records(args.append, args.snapshot)
+        print(f"{stamp['rows']:,} rows, dataset version {stamp['version']}")
+        raise SystemExit
+
+    if args.stream_to:
+        cube = stream_ingest(find_source_csv(args.csv), args.stream_to, args.chunksize)
+        print(f"{cube.n_rows:,} rows written to {args.stream_to}")
+        raise SystemExit
+
+    if args.memory_report:
+        engineered = clean_data(pd.read_csv(find_source_csv(args.csv)))
+        report = memory_report(engineered, compact_data(engineered))
+        print((report / 2**20).round(2).rename(columns=lambda c: f"{c} (MiB)").to_string())
+        raise SystemExit
+
+    data, _, version = publish_dataset(args.csv, args.snapshot, rebuild=args.rebuild)
+    print(f"{len(data):,} rows, dataset version {version}")
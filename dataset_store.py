@@ -0,0 +1,135 @@
+# ==============================
+# Dataset Store
+# ==============================
+# Holds the dataset the app serves and swaps in new snapshot versions while
+# the server is running. Callbacks read `store.current` once per request and
+# use that state throughout, so a swap never mixes two versions in one
+# response and in-flight requests finish on the version they started with.
+# The frame is a read-only view of the memory-mapped snapshot, so processes
+# serving the same snapshot share its pages.
+#
+# Filtered figures are answered by a query backend (query_backend.py):
+# pandas over the mapped frame, or DuckDB over a Parquet copy of the
+# snapshot with backend="duckdb".
+#
+# With a sample fraction or latency budget configured, each state also holds
+# a weighted stratified sample of its rows with its own cube and index, for
+# the approximate mode of the figures.
+import time
+import logging
+import threading
+from collections import namedtuple
+from data_processing import (
+    PIPELINE_VERSION, publish_dataset, read_stamp, read_cube, map_snapshot,
+    snapshot_path_from_env, build_cube, merge_cubes, stratified_sample, sample_fraction_for_budget,
+    export_parquet,
+)
+from query_backend import PandasBackend, DuckDBBackend
+
+logger = logging.getLogger(__name__)
+
+DatasetState = namedtuple("DatasetState", ["version", "data", "cube", "backend", "sample"], defaults=(None,))
+Sample = namedtuple("Sample", ["fraction", "rows", "cube", "backend"])
+
+
+class DatasetStore:
+    def __init__(self, csv_path=None, snapshot_path=None, sample_fraction=None, sample_budget=None,
+                 backend="pandas"):
+        # sample_fraction: share of every stratum to keep; sample_budget:
+        # seconds a filtered re-aggregation may take, the fraction follows
+        if backend not in ("pandas", "duckdb"):
+            raise ValueError(f"Unknown query backend {backend!r}")
+        self.csv_path = csv_path
+        self.snapshot_path = snapshot_path_from_env(snapshot_path)
+        self.backend = backend
+        self.sample_fraction = sample_fraction
+        self.sample_budget = sample_budget
+        self.current = None
+        self.error = None
+        self.ready = threading.Event()
+
+    def load(self):
+        data, cube, version = publish_dataset(self.csv_path, self.snapshot_path)
+        self.current = DatasetState(version, data, cube, self.query_backend(data, version), self.sample(data))
+        self.ready.set()
+        return self.current
+
+    def query_backend(self, data, version):
+        if self.backend == "duckdb":
+            return DuckDBBackend(export_parquet(self.snapshot_path, version))
+        return PandasBackend(data)
+
+    @property
+    def sampling(self):
+        return bool(self.sample_fraction or self.sample_budget)
+
+    def sample(self, data):
+        # Sample of `data` for the approximate mode, or None when sampling is
+        # off or would keep every row
+        if not self.sampling:
+            return None
+        fraction = self.sample_fraction or sample_fraction_for_budget(data, self.sample_budget)
+        if fraction >= 1:
+            return None
+        rows = stratified_sample(data, fraction)
+        logger.info("Approximate mode: %d of %d rows (fraction %.4f)", len(rows), len(data), fraction)
+        return Sample(fraction, rows, build_cube(rows, weight="weight"), PandasBackend(rows, weight="weight"))
+
+    def load_in_background(self, on_loaded=None):
+        # load() in a daemon thread; `ready` is set once `current` is
+        # available, and a failure is kept in `error`
+        def run():
+            try:
+                state = self.load()
+            except Exception as exc:
+                self.error = exc
+                logger.exception("Loading the dataset failed")
+                return
+            if on_loaded is not None:
+                on_loaded(state)
+
+        thread = threading.Thread(target=run, name="dataset-load", daemon=True)
+        thread.start()
+        return thread
+
+    def refresh(self):
+        # Pick up a newer snapshot version, with the cube published for it
+        # (append_records() writes one). Without one, when the version only
+        # appended rows to the one being served, just those rows are
+        # aggregated and the cube is updated by delta. Returns True if a new
+        # version was swapped in.
+        stamp = read_stamp(self.snapshot_path)
+        state = self.current
+        if stamp is None or stamp["version"] == state.version or stamp["pipeline_version"] != PIPELINE_VERSION:
+            return False
+
+        data = map_snapshot(self.snapshot_path)
+        if len(data) != stamp["rows"]:
+            # Stamp and snapshot file were caught mid-replace; retry next time
+            return False
+
+        backend = self.query_backend(data, stamp["version"])
+        rows_at = {entry["version"]: entry["rows"] for entry in stamp.get("history", [])}
+        cube = read_cube(self.snapshot_path, stamp["version"])
+        if cube is None and rows_at.get(state.version) == len(state.data):
+            cube = merge_cubes([state.cube, build_cube(data.iloc[len(state.data):])])
+        elif cube is None:
+            cube = backend.build_cube()
+        self.current = DatasetState(stamp["version"], data, cube, backend, self.sample(data))
+        logger.info("Serving dataset version %s (%d rows)", stamp["version"], len(data))
+        return True
+
+    def watch(self, interval, on_change=None):
+        # Poll the snapshot stamp every `interval` seconds in a daemon thread
+        def poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.refresh() and on_change is not None:
+                        on_change(self.current)
+                except Exception:
+                    logger.exception("Reloading the dataset snapshot failed")
+
+        thread = threading.Thread(target=poll, name="dataset-watch", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,267 @@
+# ==============================
+# Static Export
+# ==============================
+# Precomputes every age selection (15) for every tab (5) and writes a static
+# site that can be served from a CDN without any Python server:
+#
+#   python export_static.py --out site/
+#
+#   site/index.html                     layout and a small JS switcher
+#   site/plotly.min.js
+#   site/kpis.json                      per-age-group sums for the stat cards
+#   site/figures/<ages>/<tab>.json      {figure name: figure} per selection and tab
+#   site/manifest.json                  dataset version the site was built from
+#
+# Selections are built in parallel worker processes. Nothing is rebuilt when
+# the dataset version and the figure code are unchanged since the last export.
+import os
+import json
+import shutil
+import hashlib
+import argparse
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+import plotly.offline
+import data_processing as dp
+from dashboard_layouts import TAB_FIGURES, create_figures
+from payload import figure_to_json
+from figure_cache import age_selections
+
+# Source files whose changes alter the exported figures or page
+SOURCE_FILES = ["data_processing.py", "dashboard_layouts.py", "figure_cache.py", "payload.py", "export_static.py"]
+
+# Figures laid out across both columns, as in app.tab_layout
+FULL_WIDTH = ["fig_gender_occ", "fig_work_pie", "fig_work_sex", "fig_heatmap", "fig_edu_occ", "fig_gender_gap"]
+
+TAB_LABELS = {
+    "overview": "📈 Overview",
+    "demographics": "👥 Demographics",
+    "work": "💼 Work & Income",
+    "education": "🎓 Education",
+    "relationships": "💑 Relationships",
+}
+
+
+def selection_slug(selection):
+    return "_".join(selection)
+
+
+def source_sha256():
+    root = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for name in SOURCE_FILES:
+        digest.update(dp.file_sha256(os.path.join(root, name)).encode())
+    return digest.hexdigest()
+
+
+# Worker processes read the published cube once and keep it
+_cube = None
+
+
+def _init_worker(snapshot_path, version):
+    global _cube
+    _cube = dp.read_cube(snapshot_path, version)
+
+
+def _export_selection(selection, out_dir):
+    # Write one JSON file per tab for this age selection; returns bytes written
+    selected = _cube.select(list(selection))
+    written = 0
+    folder = os.path.join(out_dir, "figures", selection_slug(selection))
+    os.makedirs(folder, exist_ok=True)
+    for tab, names in TAB_FIGURES.items():
+        figs = create_figures(selected, names)
+        body = "{" + ",".join(f"{json.dumps(name)}:{figure_to_json(figs[name])}" for name in names) + "}"
+        with open(os.path.join(folder, f"{tab}.json"), "w") as f:
+            f.write(body)
+        written += len(body)
+    return written
+
+
+def export_site(out_dir, csv_path=None, snapshot_path=None, workers=None, force=False):
+    # Returns the manifest of the site in out_dir
+    snapshot_path = dp.snapshot_path_from_env(snapshot_path)
+    _, cube, version = dp.publish_dataset(csv_path, snapshot_path)
+    code_sha256 = source_sha256()
+
+    try:
+        with open(os.path.join(out_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+        if not force and manifest["version"] == version and manifest["source_sha256"] == code_sha256:
+            return {**manifest, "skipped": True}
+    except (OSError, ValueError, KeyError):
+        pass
+
+    # Built next to out_dir and swapped in, so the site is never half-updated
+    tmp_dir = f"{out_dir.rstrip(os.sep)}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    selections = list(age_selections())
+    workers = workers or os.cpu_count() or 1
+    if workers > 1:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(snapshot_path, version)) as pool:
+            sizes = list(pool.map(_export_selection, selections, [tmp_dir] * len(selections)))
+    else:
+        _init_worker(snapshot_path, version)
+        sizes = [_export_selection(selection, tmp_dir) for selection in selections]
+
+    groups = cube.totals_by_age()
+    kpis = {age: {measure: int(value) for measure, value in row.items()} for age, row in groups.iterrows()}
+    with open(os.path.join(tmp_dir, "kpis.json"), "w") as f:
+        json.dump(kpis, f)
+    with open(os.path.join(tmp_dir, "plotly.min.js"), "w") as f:
+        f.write(plotly.offline.get_plotlyjs())
+    with open(os.path.join(tmp_dir, "index.html"), "w") as f:
+        f.write(render_index())
+
+    manifest = {
+        "version": version,
+        "source_sha256": code_sha256,
+        "generated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "selections": len(selections),
+        "tabs": list(TAB_FIGURES),
+        "figure_bytes": sum(sizes),
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return manifest
+
+
+def render_index():
+    config = {
+        "ageLabels": dp.AGE_LABELS,
+        "tabs": TAB_FIGURES,
+        "tabLabels": TAB_LABELS,
+        "fullWidth": FULL_WIDTH,
+    }
+    return INDEX_HTML.replace("__CONFIG__", json.dumps(config, ensure_ascii=False))
+
+
+INDEX_HTML = '''<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Adult Census Dashboard</title>
+    <script src="plotly.min.js"></script>
+    <style>
+        body { margin: 0; font-family: 'Segoe UI', sans-serif; background: #f8f9fa; }
+        h1 { text-align: center; color: white; padding: 30px; margin: 0;
+             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
+        .panel { padding: 20px; background: white; margin: 20px; border-radius: 12px; box-shadow: 0 2px 4px rgba(0,0,0,0.05); }
+        .panel label { margin-right: 20px; }
+        .tabs { margin: 0 20px 20px 20px; display: flex; gap: 5px; }
+        .tabs button { flex: 1; padding: 12px; font-weight: bold; border: 1px solid #d6d6d6; background: #f9f9f9; cursor: pointer; }
+        .tabs button.active { color: #667eea; background: white; border-top: 2px solid #667eea; }
+        .content { padding: 0 20px 20px 20px; }
+        .cards { display: grid; grid-template-columns: repeat(4, 1fr); gap: 20px; margin-bottom: 30px; }
+        .stat-card { background: white; padding: 20px; border-radius: 12px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+                     text-align: center; border-left: 5px solid #667eea; }
+        .stat-card h2 { font-size: 40px; }
+        .grid { display: grid; grid-template-columns: 1fr 1fr; gap: 20px; }
+        .grid .full { grid-column: span 2; }
+        .message { text-align: center; padding: 50px; }
+    </style>
+</head>
+<body>
+    <h1>📊 Adult Census Income</h1>
+    <div class="panel"><b>🔍 Filter by Age Group:</b> <span id="ages"></span></div>
+    <div class="tabs" id="tabs"></div>
+    <div class="content">
+        <div class="cards" id="cards">
+            <div class="stat-card"><h3 style="color: #667eea">Total Records</h3><h2 id="kpi-count">–</h2></div>
+            <div class="stat-card"><h3 style="color: #10b981">High Earners</h3><h2 id="kpi-high-earners">–</h2></div>
+            <div class="stat-card"><h3 style="color: #f59e0b">Avg Age</h3><h2 id="kpi-age">–</h2></div>
+            <div class="stat-card"><h3 style="color: #ef4444">Avg Hours/Week</h3><h2 id="kpi-hours">–</h2></div>
+        </div>
+        <div id="figures"></div>
+    </div>
+    <script>
+        const CONFIG = __CONFIG__;
+        const cache = {};
+        let currentTab = "overview";
+        let kpis = null;
+
+        function selectedAges() {
+            return CONFIG.ageLabels.filter(age => document.getElementById("age-" + age).checked);
+        }
+
+        function fetchJson(url) {
+            if (!(url in cache)) {
+                cache[url] = fetch(url).then(response => response.json());
+            }
+            return cache[url];
+        }
+
+        function updateCards(ages) {
+            const totals = {count: 0, high_earners: 0, age_sum: 0, hours_sum: 0};
+            ages.forEach(age => Object.keys(totals).forEach(key => totals[key] += (kpis[age] || {})[key] || 0));
+            const values = totals.count ? [
+                totals.count.toLocaleString("en-US"),
+                (totals.high_earners / totals.count * 100).toFixed(1) + "%",
+                (totals.age_sum / totals.count).toFixed(1),
+                (totals.hours_sum / totals.count).toFixed(1),
+            ] : ["–", "–", "–", "–"];
+            ["count", "high-earners", "age", "hours"].forEach((id, i) => document.getElementById("kpi-" + id).textContent = values[i]);
+        }
+
+        async function render() {
+            const ages = selectedAges();
+            const tab = currentTab;
+            document.querySelectorAll("#tabs button").forEach(b => b.classList.toggle("active", b.dataset.tab === tab));
+            document.getElementById("cards").style.display = tab === "overview" ? "grid" : "none";
+            const target = document.getElementById("figures");
+            if (!ages.length) {
+                target.innerHTML = '<div class="message">Please select at least one age group.</div>';
+                updateCards(ages);
+                return;
+            }
+            kpis = kpis || await fetchJson("kpis.json");
+            updateCards(ages);
+            const figures = await fetchJson("figures/" + ages.join("_") + "/" + tab + ".json");
+            if (tab !== currentTab || ages.join() !== selectedAges().join()) {
+                return;  // the selection changed while loading
+            }
+            target.innerHTML = '<div class="grid">' + CONFIG.tabs[tab].map(name =>
+                '<div id="' + name + '"' + (CONFIG.fullWidth.includes(name) ? ' class="full"' : '') + '></div>'
+            ).join("") + '</div>';
+            CONFIG.tabs[tab].forEach(name => Plotly.newPlot(name, figures[name].data, figures[name].layout));
+        }
+
+        document.getElementById("ages").innerHTML = CONFIG.ageLabels.map(age =>
+            '<label><input type="checkbox" id="age-' + age + '" checked> ' + age + '</label>'
+        ).join("");
+        document.getElementById("tabs").innerHTML = Object.keys(CONFIG.tabs).map(tab =>
+            '<button data-tab="' + tab + '">' + CONFIG.tabLabels[tab] + '</button>'
+        ).join("");
+        document.querySelectorAll("#ages input").forEach(input => input.addEventListener("change", render));
+        document.querySelectorAll("#tabs button").forEach(button => button.addEventListener("click", () => {
+            currentTab = button.dataset.tab;
+            render();
+        }));
+        render();
+    </script>
+</body>
+</html>
+'''
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the dashboard as a static site for every age selection.")
+    parser.add_argument("--out", default="site", help="output directory (default: %(default)s)")
+    parser.add_argument("--csv", help="local source CSV (default: CENSUS_CSV or the Kaggle download)")
+    parser.add_argument("--snapshot", help=f"snapshot path (default: CENSUS_SNAPSHOT or {dp.DEFAULT_SNAPSHOT})")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the dataset and code are unchanged")
+    args = parser.parse_args()
+
+    manifest = export_site(args.out, args.csv, args.snapshot, args.workers, args.force)
+    if manifest.get("skipped"):
+        print(f"{args.out} is already up to date (dataset version {manifest['version']})")
+    else:
+        print(f"Exported {manifest['selections']} selections x {len(manifest['tabs'])} tabs "
+              f"({manifest['figure_bytes'] / 2**20:.1f} MiB of figures) to {args.out}, "
+              f"dataset version {manifest['version']}")
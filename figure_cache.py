@@ -0,0 +1,94 @@
+# ==============================
+# Figure Cache
+# ==============================
+import itertools
+import threading
+from collections import OrderedDict
+from data_processing import AGE_LABELS
+from dashboard_layouts import TAB_FIGURES, create_figures
+from bitmap_index import filter_key
+from metrics import span
+
+
+def selection_key(selected_ages):
+    # Same selection in any order (or with duplicates) maps to one key
+    return tuple(age for age in AGE_LABELS if age in selected_ages)
+
+
+def age_selections():
+    # Every non-empty combination of age groups (15 for four groups)
+    for size in range(1, len(AGE_LABELS) + 1):
+        yield from itertools.combinations(AGE_LABELS, size)
+
+
+# Bounded LRU of serialized figure JSON keyed by (age selection, filters,
+# tab, dataset version, exact). Safe to share between Dash's request threads.
+# Figures are built from a DatasetState: its cube, narrowed by its query
+# backend when there are filters, or the same from its sample unless `exact`.
+class FigureCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, state, selected_ages, tab, filters=None, exact=True):
+        selection = selection_key(selected_ages)
+        filters = filter_key(filters)
+        exact = exact or state.sample is None
+        key = (selection, filters, tab, state.version, exact)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Build outside the lock so other selections are served meanwhile
+        with span('filter'):
+            source = state if exact else state.sample
+            selected = source.backend.select_cube(source.cube, selection, dict(filters))
+        failed = []
+        figures_json = create_figures(
+            selected, TAB_FIGURES.get(tab, []), serialize=True,
+            on_error=lambda name, exc: failed.append(name),
+        )
+
+        with self._lock:
+            if failed:
+                # Placeholders are served but not cached, so the next request retries
+                self.failures += len(failed)
+                return figures_json
+            self._entries[key] = figures_json
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return figures_json
+
+    def warm(self, state, exact=True):
+        # Prebuild every age selection (without filters) for every tab
+        for selection in age_selections():
+            for tab in TAB_FIGURES:
+                self.get(state, selection, tab, exact=exact)
+
+    def collect(self):
+        # Prometheus samples for metrics.register_collector
+        stats = self.stats()
+        return [
+            ('dashboard_figure_cache_hits_total', 'counter', 'Figure cache hits.', {}, stats['hits']),
+            ('dashboard_figure_cache_misses_total', 'counter', 'Figure cache misses.', {}, stats['misses']),
+            ('dashboard_figure_cache_entries', 'gauge', 'Cached (selection, tab) entries.', {}, stats['size']),
+            ('dashboard_figure_failures_total', 'counter', 'Figures replaced by a placeholder.', {}, stats['failures']),
+        ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'failures': self.failures,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
@@ -0,0 +1,40 @@
+# ==============================
+# Gunicorn Settings
+# ==============================
+#   gunicorn "app:create_server()"
+#
+# The master builds the snapshot and its cube before forking, so workers
+# start by mapping the published files instead of each running the pipeline
+# (and being killed by the worker timeout while they do).
+#
+# With DASHBOARD_LAZY_START=1 the master skips this and the workers start
+# serving at once. Each one publishes the dataset from its background load();
+# snapshot_lock makes the first of them build what is missing while the
+# others wait for it and then map the result.
+#
+# Workers share their metrics through DASHBOARD_METRICS_DIR (a temporary
+# directory unless set), so /metrics covers all of them whichever answers.
+import os
+import glob
+import tempfile
+from data_processing import publish_dataset
+
+bind = os.environ.get("DASHBOARD_BIND", "0.0.0.0:8050")
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+
+def on_starting(server):
+    # Metrics of a previous run would be added to this one's
+    metrics_dir = os.environ.get("DASHBOARD_METRICS_DIR") or tempfile.mkdtemp(prefix="dashboard-metrics-")
+    os.environ["DASHBOARD_METRICS_DIR"] = metrics_dir
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+        os.remove(path)
+
+    # A requested rebuild still runs here in lazy mode: a worker restarted
+    # later would otherwise rebuild the snapshot again
+    if os.environ.get("DASHBOARD_LAZY_START") == "1" and os.environ.get("CENSUS_REBUILD") != "1":
+        return
+    publish_dataset()
+    # Rebuilt once here; workers must not rebuild it again
+    os.environ.pop("CENSUS_REBUILD", None)
@@ -0,0 +1,329 @@
+# ==============================
+# Income Insights
+# ==============================
+# Statistics on what predicts income >50K in an age selection (and filters):
+# mutual information of each engineered feature with income, odds ratios of
+# each feature value against the feature's most common value, and a
+# logistic regression on all features together.
+#
+# All three only need (rows, high earners) per combination of feature values,
+# which the cube already holds, so they are computed from its counts and
+# never rescan the rows. Each cube cell is a binomial observation, so the
+# regression fitted on cells is the same as one fitted on individual rows.
+#
+# They still take too long to run inside a request. InsightRunner computes
+# them in a process pool and keeps the results as JSON files on disk, keyed
+# by dataset version, age selection and filters. Those files are shared by
+# all server workers and survive restarts. Until a result is there, the tab
+# shows a pending state; a computation that fails is not retried and the tab
+# shows an error instead.
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import plotly.express as px
+from data_processing import CUBE_DIMENSIONS
+from bitmap_index import filter_key
+from figure_cache import selection_key
+
+logger = logging.getLogger(__name__)
+
+INSIGHTS_TAB = 'insights'
+
+# Engineered categorical columns the statistics are computed for
+FEATURES = [column for column in CUBE_DIMENSIONS if column not in ("age_range", "income")]
+
+# Ridge penalty on the regression coefficients (not the intercept). Keeps a
+# value with no (or only) high earners from driving its coefficient to
+# infinity; negligible next to the information in well-populated values.
+RIDGE = 1.0
+
+# Part of every cache key: bump it when the statistics change, so results
+# cached by the previous code are not served
+INSIGHTS_VERSION = 1
+
+
+def _feature_counts(counts, feature):
+    # Rows and high earners per value of `feature`, most common value first
+    grouped = counts.groupby(feature, observed=True)[["count", "high_earners"]].sum()
+    return grouped[grouped["count"] > 0].sort_values("count", ascending=False, kind="stable")
+
+
+def mutual_information(counts):
+    # I(feature; income) in bits for every feature, highest first
+    total = counts["count"].sum()
+    high = counts["high_earners"].sum()
+    income = np.array([total - high, high]) / total
+    result = []
+    for feature in FEATURES:
+        grouped = _feature_counts(counts, feature)
+        joint = np.column_stack([grouped["count"] - grouped["high_earners"], grouped["high_earners"]]) / total
+        expected = joint.sum(axis=1, keepdims=True) * income
+        with np.errstate(divide="ignore", invalid="ignore"):
+            terms = np.where(joint > 0, joint * np.log2(joint / expected), 0.0)
+        result.append({"feature": feature, "bits": float(terms.sum())})
+    return sorted(result, key=lambda row: -row["bits"])
+
+
+def odds_ratios(counts, z=1.96):
+    # Odds of >50K for each value relative to the feature's most common
+    # value, with a Wald interval on the log odds ratio (0.5 is added to
+    # every cell of a 2x2 table that has an empty cell)
+    result = []
+    for feature in FEATURES:
+        grouped = _feature_counts(counts, feature)
+        if len(grouped) < 2:
+            continue
+        reference = grouped.index[0]
+        ref_high = grouped["high_earners"].iloc[0]
+        ref_low = grouped["count"].iloc[0] - ref_high
+        for value, row in grouped.iloc[1:].iterrows():
+            cells = np.array([row["high_earners"], row["count"] - row["high_earners"], ref_high, ref_low], dtype=float)
+            if (cells == 0).any():
+                cells += 0.5
+            log_or = np.log(cells[0] * cells[3] / (cells[1] * cells[2]))
+            se = np.sqrt((1 / cells).sum())
+            result.append({
+                "feature": feature, "value": str(value), "reference": str(reference), "count": int(row["count"]),
+                "odds_ratio": float(np.exp(log_or)),
+                "low": float(np.exp(log_or - z * se)), "high": float(np.exp(log_or + z * se)),
+            })
+    return result
+
+
+def logistic_regression(counts, z=1.96, max_iter=50, tol=1e-8):
+    # Income >50K on one-hot features (each feature's most common value as
+    # the baseline), fitted by Newton-Raphson / IRLS on the cube cells
+    cells = counts.groupby(FEATURES, observed=True)[["count", "high_earners"]].sum().reset_index()
+    cells = cells[cells["count"] > 0]
+    n = cells["count"].to_numpy(float)
+    y = cells["high_earners"].to_numpy(float)
+
+    columns, terms = [np.ones(len(cells))], ["(intercept)"]
+    for feature in FEATURES:
+        values = _feature_counts(counts, feature).index[1:]
+        for value in values:
+            columns.append((cells[feature] == value).to_numpy(float))
+            terms.append(f"{feature} = {value}")
+    X = np.column_stack(columns)
+    penalty = np.full(X.shape[1], RIDGE)
+    penalty[0] = 0.0
+
+    beta = np.zeros(X.shape[1])
+    converged = False
+    for iteration in range(1, max_iter + 1):
+        p = 1 / (1 + np.exp(-(X @ beta)))
+        gradient = X.T @ (y - n * p) - penalty * beta
+        hessian = (X * (n * p * (1 - p))[:, None]).T @ X + np.diag(penalty)
+        step = np.linalg.solve(hessian, gradient)
+        beta += step
+        if np.abs(step).max() < tol:
+            converged = True
+            break
+    se = np.sqrt(np.diag(np.linalg.inv(hessian)))
+
+    return {
+        "iterations": iteration,
+        "converged": converged,
+        "intercept": float(beta[0]),
+        "coefficients": [
+            {"term": term, "coef": float(b), "low": float(b - z * s), "high": float(b + z * s)}
+            for term, b, s in zip(terms[1:], beta[1:], se[1:])
+        ],
+    }
+
+
+def compute_insights(counts):
+    # All statistics for the cube rows `counts` of one selection
+    start = time.perf_counter()
+    total = int(counts["count"].sum())
+    high = int(counts["high_earners"].sum())
+    result = {"rows": total, "high_earners": high}
+    if total and 0 < high < total:
+        result.update(
+            mutual_information=mutual_information(counts),
+            odds_ratios=odds_ratios(counts),
+            logistic=logistic_regression(counts),
+        )
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _compute_to_file(counts, path, key):
+    # Runs in the pool: compute and write atomically, so readers never see
+    # a partial file
+    result = {**key, **compute_insights(counts)}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(result, f)
+    os.replace(tmp_path, path)
+
+
+# ==============================
+# Background Runner
+# ==============================
+def _pool_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+class InsightRunner:
+    def __init__(self, cache_dir, workers=1):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.completed = 0
+        self.failures = 0
+        self._pending = {}   # cache file -> future
+        self._failed = {}    # cache file -> error message
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _path(self, version, key):
+        digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:32]
+        return os.path.join(self.cache_dir, version, f"{digest}.json")
+
+    def get(self, state, selected_ages, filters=None):
+        # Insights for this selection if they are ready ({"error": message}
+        # if computing them failed), else None after making sure they are
+        # being computed
+        selection = selection_key(selected_ages)
+        filters = filter_key(filters)
+        key = {
+            "ages": list(selection), "filters": {column: list(values) for column, values in filters},
+            "insights_version": INSIGHTS_VERSION, "ridge": RIDGE,
+        }
+        path = self._path(state.version, key)
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        with self._lock:
+            if path in self._failed:
+                return {"error": self._failed[path]}
+            if path in self._pending:
+                return None
+            if self._executor is None:
+                # Not forked: the server process has request threads and a
+                # dataset-watch thread whose locks a forked child could
+                # inherit while they are held
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_pool_context())
+            version_dir = os.path.dirname(path)
+            if not os.path.isdir(version_dir):
+                self._prune(state.version)
+                os.makedirs(version_dir, exist_ok=True)
+            counts = state.cube.counts[state.cube.matching(selection, dict(filters))]
+            future = self._executor.submit(_compute_to_file, counts, path, key)
+            self._pending[path] = future
+        future.add_done_callback(lambda done: self._finished(path, done))
+        return None
+
+    def _finished(self, path, future):
+        with self._lock:
+            self._pending.pop(path, None)
+            if future.exception() is None:
+                self.completed += 1
+                return
+            self.failures += 1
+            self._failed[path] = repr(future.exception())
+            if self._executor is not None and isinstance(future.exception(), BrokenExecutor):
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+        logger.error("Computing insights failed: %r", future.exception())
+
+    def _prune(self, version):
+        # Results of versions older than the one before `version` are no
+        # longer served. The previous version's are kept for workers that
+        # have not swapped in `version` yet: the most recently written
+        # directory is theirs, whether it was appended to or rebuilt.
+        if not os.path.isdir(self.cache_dir):
+            return
+        others = sorted(
+            (entry for entry in os.listdir(self.cache_dir) if entry != version),
+            key=lambda entry: os.path.getmtime(os.path.join(self.cache_dir, entry)),
+        )
+        for entry in others[:-1]:
+            shutil.rmtree(os.path.join(self.cache_dir, entry), ignore_errors=True)
+        kept = {version, *others[-1:]}
+        self._failed = {path: error for path, error in self._failed.items()
+                        if os.path.basename(os.path.dirname(path)) in kept}
+
+    def collect(self):
+        # Prometheus samples for metrics.register_collector
+        with self._lock:
+            pending = len(self._pending)
+        return [
+            ('dashboard_insight_jobs_pending', 'gauge', 'Insight computations queued or running.', {}, pending),
+            ('dashboard_insight_jobs_completed_total', 'counter', 'Insight computations finished.', {}, self.completed),
+            ('dashboard_insight_jobs_failed_total', 'counter', 'Insight computations that failed.', {}, self.failures),
+        ]
+
+
+# ==============================
+# Insight Figures
+# ==============================
+def _label(column):
+    return column.replace("_", " ").capitalize()
+
+
+def fig_mutual_information(result):
+    frame = pd.DataFrame(result["mutual_information"])
+    frame["feature"] = frame["feature"].map(_label)
+    fig = px.bar(
+        frame.iloc[::-1], x="bits", y="feature", orientation="h",
+        color_discrete_sequence=['#667eea'],
+        labels={"bits": "Mutual information with income (bits)", "feature": ""},
+        title="Which Features Tell Most About Income"
+    )
+    fig.update_layout(template="plotly_white")
+    return fig
+
+
+def fig_odds_ratios(result):
+    frame = pd.DataFrame(result["odds_ratios"])
+    frame["label"] = frame["feature"].map(_label) + ": " + frame["value"]
+    frame["error_plus"] = frame["high"] - frame["odds_ratio"]
+    frame["error_minus"] = frame["odds_ratio"] - frame["low"]
+    frame["baseline"] = frame["reference"]
+    fig = px.scatter(
+        frame.iloc[::-1], x="odds_ratio", y="label", color="feature",
+        error_x="error_plus", error_x_minus="error_minus", log_x=True,
+        hover_data={"baseline": True, "count": True, "feature": False, "label": False},
+        labels={"odds_ratio": "Odds ratio of >50K vs the most common value (log scale)", "label": ""},
+        title="Odds Ratios by Feature Value (95% CI)"
+    )
+    fig.add_vline(x=1, line_dash="dash", line_color="#9ca3af")
+    fig.update_layout(template="plotly_white", showlegend=False, height=max(400, 22 * len(frame)))
+    return fig
+
+
+def fig_logistic(result):
+    frame = pd.DataFrame(result["logistic"]["coefficients"])
+    frame["error_plus"] = frame["high"] - frame["coef"]
+    frame["error_minus"] = frame["coef"] - frame["low"]
+    frame["direction"] = np.where(frame["coef"] >= 0, "raises odds", "lowers odds")
+    fig = px.bar(
+        frame.iloc[::-1], x="coef", y="term", orientation="h", color="direction",
+        error_x="error_plus", error_x_minus="error_minus",
+        color_discrete_map={"raises odds": '#10b981', "lowers odds": '#ef4444'},
+        labels={"coef": "Coefficient (log odds of >50K, 95% CI)", "term": ""},
+        title="Logistic Regression: All Features Together"
+    )
+    fig.update_layout(template="plotly_white", showlegend=False, height=max(400, 22 * len(frame)))
+    return fig
+
+
+def insight_figures(result):
+    return {
+        'fig_mutual_information': fig_mutual_information(result),
+        'fig_odds_ratios': fig_odds_ratios(result),
+        'fig_logistic': fig_logistic(result),
+    }
@@ -0,0 +1,332 @@
+# ==============================
+# Load Test
+# ==============================
+# Replays dashboard sessions against a running server, or against one started
+# here, to find how many concurrent users a deployment handles:
+#
+#   python loadtest.py --users 50 --duration 60                 # one server process
+#   python loadtest.py --users 50 --workers 1,4 --output load.json
+#   python loadtest.py --users 50 --url http://host:8050        # existing server
+#
+# Every simulated user loads the page, then switches tabs and changes the age
+# (and, with --filter-rate, demographic) filters as Poisson processes. Only
+# the `_dash-update-component` POSTs a browser would send are sent: like
+# assets/dashboard.js, a user only asks for a tab that is not already
+# rendered for its current selection. Reports throughput, errors and
+# p50/p95/p99 latency per tab.
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+import importlib.util
+from collections import defaultdict
+import numpy as np
+import requests
+from data_processing import AGE_LABELS
+from bitmap_index import FILTER_COLUMNS
+from insights import INSIGHTS_TAB
+from app import TABS
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Callback outputs as app.py declares them; Dash identifies a callback by them
+RENDER_OUTPUTS = [
+    *((f'content-{tab}', 'children') for tab in TABS), ('rendered-tabs', 'data'), ('insights-poll', 'disabled'),
+]
+AGGREGATE_OUTPUTS = [('age-aggregates', 'data'), ('data-ready-poll', 'disabled')]
+OPTION_OUTPUTS = [(f'{column}-filter', 'options') for column in FILTER_COLUMNS]
+
+
+def _callback_body(outputs, inputs, state=(), changed=()):
+    # `_dash-update-component` request for a callback with several outputs
+    return {
+        'output': '..' + '...'.join(f'{id_}.{prop}' for id_, prop in outputs) + '..',
+        'outputs': [{'id': id_, 'property': prop} for id_, prop in outputs],
+        'inputs': [{'id': id_, 'property': prop, 'value': value} for id_, prop, value in inputs],
+        'state': [{'id': id_, 'property': prop, 'value': value} for id_, prop, value in state],
+        'changedPropIds': [f'{id_}.{prop}' for id_, prop in changed],
+    }
+
+
+class Recorder:
+    # Latencies and errors per request kind, from `start` on
+    def __init__(self, start):
+        self.start = start
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, kind, began, seconds, ok):
+        if began < self.start:
+            return
+        with self._lock:
+            if ok:
+                self.latencies[kind].append(seconds)
+            else:
+                self.errors[kind] += 1
+
+    def report(self, elapsed):
+        kinds = sorted(set(self.latencies) | set(self.errors))
+        rows = {}
+        for kind in kinds:
+            latencies = np.array(self.latencies[kind])
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (np.nan,) * 3
+            rows[kind] = {
+                'requests': len(latencies),
+                'errors': self.errors[kind],
+                'p50_ms': round(p50 * 1000, 1),
+                'p95_ms': round(p95 * 1000, 1),
+                'p99_ms': round(p99 * 1000, 1),
+            }
+        total = sum(row['requests'] for row in rows.values())
+        errors = sum(row['errors'] for row in rows.values())
+        return {
+            'seconds': round(elapsed, 1),
+            'requests': total,
+            'errors': errors,
+            'throughput_rps': round(total / elapsed, 1) if elapsed else 0.0,
+            'kinds': rows,
+        }
+
+
+class User:
+    # One browser session: the dashboard's client-side state plus the
+    # requests the browser would send for each interaction
+    def __init__(self, url, recorder, rng, timeout):
+        self.url = url
+        self.recorder = recorder
+        self.rng = rng
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.tab = 'overview'
+        self.ages = list(AGE_LABELS)
+        self.filters = {column: [] for column in FILTER_COLUMNS}
+        self.options = {column: [] for column in FILTER_COLUMNS}
+        self.aggregates = None
+        self.rendered = {}
+
+    def _send(self, kind, method, path, body=None):
+        began = time.perf_counter()
+        try:
+            response = self.session.request(method, self.url + path, json=body, timeout=self.timeout)
+            ok = response.status_code in (200, 204)
+        except requests.RequestException:
+            response, ok = None, False
+        self.recorder.record(kind, began, time.perf_counter() - began, ok)
+        return response if ok else None
+
+    def load_page(self):
+        for path in ('/', '/_dash-layout', '/_dash-dependencies'):
+            self._send('page', 'GET', path)
+        self.update_aggregates()
+
+        # filter_options fills the demographic dropdowns once the data is loaded
+        body = _callback_body(OPTION_OUTPUTS, [('data-ready-poll', 'disabled', True)])
+        response = self._send('options', 'POST', '/_dash-update-component', body)
+        if response is not None and response.status_code == 200:
+            options = response.json()['response']
+            self.options = {
+                column: [option['value'] for option in options[f'{column}-filter']['options']]
+                for column in FILTER_COLUMNS
+            }
+
+    def update_aggregates(self):
+        # age_aggregates runs on page load and whenever a demographic filter changes
+        body = _callback_body(
+            AGGREGATE_OUTPUTS,
+            [('data-ready-poll', 'n_intervals', None), ('version-poll', 'n_intervals', None),
+             *((f'{column}-filter', 'value', self.filters[column]) for column in FILTER_COLUMNS)],
+            [('age-aggregates', 'data', self.aggregates)],
+        )
+        response = self._send('aggregates', 'POST', '/_dash-update-component', body)
+        if response is not None and response.status_code == 200:
+            data = response.json()['response'].get('age-aggregates', {}).get('data')
+            if data and 'groups' in data:
+                self.aggregates = data
+        self.request_render()
+
+    def request_render(self):
+        # requestRender in assets/dashboard.js, then render_content
+        if not self.aggregates:
+            return
+        ages = sorted(self.ages)
+        filters = self.aggregates.get('filters', {})
+        signature = json.dumps([ages, filters, 'approximate', self.aggregates.get('version')], separators=(',', ':'))
+        if self.rendered.get(self.tab) == signature:
+            return
+        request = {'tab': self.tab, 'signature': signature, 'ages': ages, 'filters': filters, 'exact': False}
+        body = _callback_body(
+            RENDER_OUTPUTS, [('render-request', 'data', request)],
+            [('rendered-tabs', 'data', self.rendered)], [('render-request', 'data')],
+        )
+        response = self._send(f'render:{self.tab}', 'POST', '/_dash-update-component', body)
+        if response is None:
+            return
+        # Insights still being computed are asked for again on the next action
+        if self.tab == INSIGHTS_TAB and not response.json()['response']['insights-poll']['disabled']:
+            return
+        self.rendered = {**self.rendered, self.tab: signature}
+
+    def switch_tab(self):
+        self.tab = self.rng.choice([tab for tab in TABS if tab != self.tab])
+        self.request_render()
+
+    def change_ages(self):
+        ages = [age for age in AGE_LABELS if self.rng.random() < 0.5]
+        self.ages = ages or [self.rng.choice(AGE_LABELS)]
+        self.request_render()
+
+    def change_filter(self):
+        column = self.rng.choice(FILTER_COLUMNS)
+        if self.filters[column] or not self.options[column]:
+            self.filters[column] = []
+        else:
+            self.filters[column] = [self.rng.choice(self.options[column])]
+        self.update_aggregates()
+
+
+def run_users(url, users, duration, tab_rate, age_rate, filter_rate, warmup=5.0, timeout=60.0, seed=0):
+    # Run `users` sessions for warmup + duration seconds; the report covers
+    # requests started after the warmup
+    start = time.perf_counter()
+    recorder = Recorder(start + warmup)
+    stop_at = start + warmup + duration
+    rates = {'switch_tab': tab_rate, 'change_ages': age_rate, 'change_filter': filter_rate}
+    actions = [action for action, rate in rates.items() if rate > 0]
+    total_rate = sum(rates[action] for action in actions)
+
+    def session(i):
+        rng = random.Random(seed * 100_003 + i)
+        user = User(url, recorder, rng, timeout)
+        # Stagger arrivals over the warmup
+        time.sleep(rng.uniform(0, warmup))
+        user.load_page()
+        while total_rate:
+            wait = rng.expovariate(total_rate)
+            if time.perf_counter() + wait >= stop_at:
+                break
+            time.sleep(wait)
+            action = rng.choices(actions, weights=[rates[a] for a in actions])[0]
+            getattr(user, action)()
+
+    threads = [threading.Thread(target=session, args=(i,), daemon=True) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(max(stop_at + timeout - time.perf_counter(), 0))
+    return recorder.report(time.perf_counter() - recorder.start)
+
+
+# ==============================
+# Local Server
+# ==============================
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers, threads, port):
+    # gunicorn with `workers` processes when it is installed; otherwise (one
+    # worker only) the Flask server in a single threaded process
+    if importlib.util.find_spec('gunicorn') is not None:
+        command = [
+            sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+            '--workers', str(workers), '--threads', str(threads), '--bind', f'127.0.0.1:{port}',
+            'app:create_server()',
+        ]
+        kind = f'gunicorn, {workers} worker(s) x {threads} thread(s)'
+    elif workers == 1:
+        command = [
+            sys.executable, '-c',
+            f"from app import create_app; create_app().run(host='127.0.0.1', port={port}, debug=False, threaded=True)",
+        ]
+        kind = 'flask, 1 process'
+    else:
+        raise SystemExit('More than one worker needs gunicorn (pip install gunicorn)')
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return process, kind
+
+
+def wait_ready(url, process=None, timeout=600.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit(f'The server exited with code {process.returncode}')
+        try:
+            if requests.get(url + '/ready', timeout=5).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f'{url} was not ready after {timeout:.0f}s')
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def _print_report(label, report):
+    print(f"\n== {label} ==")
+    print(f"  {report['requests']:,} requests in {report['seconds']}s: "
+          f"{report['throughput_rps']} req/s, {report['errors']} errors")
+    print(f"  {'request':<24} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for kind, row in report['kinds'].items():
+        print(f"  {kind:<24} {row['requests']:>7} {row['errors']:>7} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay dashboard sessions against the app and report latency.')
+    parser.add_argument('--url', help='server to test (default: start one locally per --workers entry)')
+    parser.add_argument('--workers', default='1',
+                        help='comma-separated server worker counts to test in turn (default: %(default)s)')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker (default: %(default)s)')
+    parser.add_argument('--users', type=int, default=20, help='concurrent simulated users (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=60, help='measured seconds (default: %(default)s)')
+    parser.add_argument('--warmup', type=float, default=5, help='unmeasured seconds first (default: %(default)s)')
+    parser.add_argument('--tab-rate', type=float, default=0.2,
+                        help='tab switches per user per second (default: %(default)s)')
+    parser.add_argument('--age-rate', type=float, default=0.1,
+                        help='age-filter changes per user per second (default: %(default)s)')
+    parser.add_argument('--filter-rate', type=float, default=0.0,
+                        help='demographic filter changes per user per second (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the reports as JSON to this file')
+    args = parser.parse_args()
+
+    settings = {key: getattr(args, key) for key in ('users', 'duration', 'warmup', 'tab_rate', 'age_rate', 'filter_rate')}
+    reports = []
+    if args.url:
+        url = args.url.rstrip('/')
+        wait_ready(url)
+        report = run_users(url, args.users, args.duration, args.tab_rate, args.age_rate, args.filter_rate,
+                           args.warmup, seed=args.seed)
+        reports.append({'server': url, **report})
+        _print_report(url, report)
+    else:
+        for workers in (int(n) for n in args.workers.split(',')):
+            port = _free_port()
+            process, kind = start_server(workers, args.threads, port)
+            try:
+                url = f'http://127.0.0.1:{port}'
+                wait_ready(url, process)
+                report = run_users(url, args.users, args.duration, args.tab_rate, args.age_rate,
+                                   args.filter_rate, args.warmup, seed=args.seed)
+            finally:
+                stop_server(process)
+            reports.append({'server': kind, 'workers': workers, **report})
+            _print_report(kind, report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'settings': settings, 'reports': reports}, f, indent=2)
@@ -0,0 +1,225 @@
+# ==============================
+# Timing Instrumentation
+# ==============================
+# Named spans around the hot path, aggregated into latency histograms and
+# exported in Prometheus text format on the Dash Flask server:
+#
+#   with span("figure", figure="fig_age"):
+#       ...
+#
+# Every process (gunicorn worker) keeps its own metrics. With a metrics
+# directory (DASHBOARD_METRICS_DIR, set by gunicorn.conf.py) each process also
+# writes them to <dir>/<pid>.json every FLUSH_INTERVAL seconds, and a scrape
+# of any worker adds up the files of all of them: histograms and counters of
+# every process that ran since the server started, gauges of the live ones.
+import os
+import json
+import glob
+import time
+import cProfile
+import functools
+import threading
+from contextlib import contextmanager
+from flask import Response, g, request
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_INTERVAL = 5.0
+
+_lock = threading.Lock()
+_histograms = {}   # (metric, sorted label items) -> [bucket counts, sum, count]
+_collectors = []   # callables returning [(metric, type, help, labels, value)]
+_profile_lock = threading.Lock()   # only one cProfile can run at a time
+
+HELP = {
+    "dashboard_span_seconds": "Time spent in instrumented sections of the request path.",
+    "dashboard_request_seconds": "Flask request latency, including Dash serialization.",
+}
+
+
+def observe(metric, seconds, **labels):
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * len(LATENCY_BUCKETS), 0.0, 0]
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                hist[0][i] += 1
+        hist[1] += seconds
+        hist[2] += 1
+
+
+@contextmanager
+def span(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("dashboard_span_seconds", time.perf_counter() - start, span=name, **labels)
+
+
+def register_collector(collect):
+    # collect() -> [(metric, type, help, labels dict, value)], read at scrape time
+    _collectors.append(collect)
+
+
+def _labels(items):
+    if not items:
+        return ""
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in items) + "}"
+
+
+def _local_state():
+    # This process's histograms and collector samples, as JSON-able lists
+    with _lock:
+        histograms = [[metric, [list(item) for item in items], list(h[0]), h[1], h[2]]
+                      for (metric, items), h in _histograms.items()]
+    samples = [[metric, kind, help_text, sorted(labels.items()), value]
+               for collect in _collectors for metric, kind, help_text, labels, value in collect()]
+    return {"pid": os.getpid(), "histograms": histograms, "samples": samples}
+
+
+def write_state(directory):
+    # Publish this process's metrics for the scrapes of the other processes
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(_local_state(), f)
+    os.replace(f"{path}.tmp", path)
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_states(directory):
+    states = []
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        try:
+            with open(path) as f:
+                states.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return states
+
+
+def _merge(states):
+    # Sum the histograms and counters of all processes, and the gauges of
+    # the ones still running
+    histograms, samples = {}, {}
+    for state in states:
+        alive = state["pid"] == os.getpid() or _is_alive(state["pid"])
+        for metric, items, buckets, total, count in state["histograms"]:
+            key = (metric, tuple(tuple(item) for item in items))
+            hist = histograms.setdefault(key, [[0] * len(LATENCY_BUCKETS), 0.0, 0])
+            hist[0] = [a + b for a, b in zip(hist[0], buckets)]
+            hist[1] += total
+            hist[2] += count
+        for metric, kind, help_text, labels, value in state["samples"]:
+            if kind == "gauge" and not alive:
+                continue
+            key = (metric, tuple(tuple(item) for item in labels))
+            if key in samples:
+                samples[key][2] += value
+            else:
+                samples[key] = [kind, help_text, value]
+    return histograms, samples
+
+
+def render_prometheus(directory=None):
+    if directory:
+        write_state(directory)
+        states = _read_states(directory)
+    else:
+        states = [_local_state()]
+    histograms, samples = _merge(states)
+
+    lines = []
+    seen = set()
+    for (metric, items), (buckets, total, count) in sorted(
+        histograms.items(), key=lambda item: (item[0][0], str(item[0][1]))
+    ):
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f"# HELP {metric} {HELP.get(metric, metric)}")
+            lines.append(f"# TYPE {metric} histogram")
+        for bound, bucket in zip(LATENCY_BUCKETS, buckets):
+            lines.append(f"{metric}_bucket{_labels(items + (('le', bound),))} {bucket}")
+        lines.append(f"{metric}_bucket{_labels(items + (('le', '+Inf'),))} {count}")
+        lines.append(f"{metric}_sum{_labels(items)} {total}")
+        lines.append(f"{metric}_count{_labels(items)} {count}")
+
+    for (metric, items), (kind, help_text, value) in samples.items():
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+        lines.append(f"{metric}{_labels(items)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def profiled(fn):
+    # Opt-in per-call cProfile dumps: set DASHBOARD_PROFILE_DIR to a directory
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profile_dir = os.environ.get("DASHBOARD_PROFILE_DIR")
+        if not profile_dir or not _profile_lock.acquire(blocking=False):
+            return fn(*args, **kwargs)
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(fn, *args, **kwargs)
+        finally:
+            _profile_lock.release()
+            os.makedirs(profile_dir, exist_ok=True)
+            stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.perf_counter_ns() % 10**9:09d}"
+            profiler.dump_stats(os.path.join(profile_dir, f"{fn.__name__}-{stamp}.prof"))
+    return wrapper
+
+
+def _flush_periodically(directory):
+    def run():
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                write_state(directory)
+            except OSError:
+                pass
+
+    thread = threading.Thread(target=run, name="metrics-flush", daemon=True)
+    thread.start()
+    return thread
+
+
+def init_app(server, path="/metrics", directory=None):
+    # Time every Flask request and serve the metrics on `path`; with a
+    # metrics `directory` (default DASHBOARD_METRICS_DIR), those of every
+    # process sharing it
+    directory = directory or os.environ.get("DASHBOARD_METRICS_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        _flush_periodically(directory)
+
+    @server.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @server.after_request
+    def _record_latency(response):
+        start = g.pop("metrics_start", None)
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        if start is not None and route != path:
+            observe("dashboard_request_seconds", time.perf_counter() - start,
+                    route=route, status=response.status_code)
+        return response
+
+    server.add_url_rule(
+        path, "metrics",
+        lambda: Response(render_prometheus(directory), mimetype="text/plain; version=0.0.4")
+    )
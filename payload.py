@@ -0,0 +1,86 @@
+# ==============================
+# Response Payload
+# ==============================
+# Figure JSON and HTTP compression, the two things that decide how many
+# bytes reach the browser. Every figure uses the plotly_white template, but
+# only the per-trace defaults of the trace types it draws (and the subplot
+# layouts those need) affect how it renders; the rest is dropped.
+import gzip
+import json
+import plotly.io as pio
+from flask import request
+
+try:
+    import orjson
+except ImportError:  # the standard json module is used instead
+    orjson = None
+
+try:
+    from flask_compress import Compress
+except ImportError:  # fall back to the gzip hook in init_app
+    Compress = None
+
+# Template layout entries used only by these trace types
+SUBPLOT_TRACE_TYPES = {
+    'geo': {'scattergeo', 'choropleth'},
+    'polar': {'scatterpolar', 'scatterpolargl', 'barpolar'},
+    'ternary': {'scatterternary'},
+    'scene': {'scatter3d', 'surface', 'mesh3d', 'cone', 'streamtube', 'isosurface', 'volume'},
+    'mapbox': {'scattermapbox', 'choroplethmapbox', 'densitymapbox'},
+    'smith': {'scattersmith'},
+}
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/css', 'text/plain', 'application/javascript'}
+
+
+def trim_template(template, trace_types):
+    # `template` (a plain dict) reduced to what figures with these trace types read
+    layout = {
+        key: value for key, value in template.get('layout', {}).items()
+        if key not in SUBPLOT_TRACE_TYPES or SUBPLOT_TRACE_TYPES[key] & trace_types
+    }
+    data = {key: value for key, value in template.get('data', {}).items() if key in trace_types}
+    return {'data': data, 'layout': layout}
+
+
+def figure_to_json(fig):
+    # Same figure as fig.to_json(), with a trimmed template, encoded with
+    # orjson when it is installed
+    figure = fig.to_plotly_json()
+    template = figure['layout'].get('template')
+    if template:
+        trace_types = {trace.get('type', 'scatter') for trace in figure['data']}
+        figure['layout'] = {**figure['layout'], 'template': trim_template(template, trace_types)}
+    return pio.json.to_json_plotly(figure, engine='orjson' if orjson is not None else 'json')
+
+
+def loads(payload):
+    return orjson.loads(payload) if orjson is not None else json.loads(payload)
+
+
+def init_app(server, minimum_size=500):
+    # Compress responses with flask-compress (brotli when `brotli` is
+    # installed) or, without it, gzip them here
+    if Compress is not None:
+        server.config.setdefault('COMPRESS_MIN_SIZE', minimum_size)
+        server.config.setdefault('COMPRESS_MIMETYPES', sorted(COMPRESSIBLE_MIMETYPES))
+        Compress(server)
+        return
+
+    @server.after_request
+    def _gzip(response):
+        if (
+            response.direct_passthrough
+            or response.status_code < 200 or response.status_code >= 300
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.headers.get('Accept-Encoding', '').lower()
+        ):
+            return response
+        body = response.get_data()
+        if len(body) < minimum_size:
+            return response
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
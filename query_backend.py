@@ -0,0 +1,142 @@
+# ==============================
+# Query Backends
+# ==============================
+# The figures only read an AggregateCube, and a cube is the answer to a few
+# group-by queries over the rows: sums per combination of CUBE_DIMENSIONS,
+# plus value counts per CUBE_DISTRIBUTIONS column. A backend runs those
+# queries:
+#
+#   backend.build_cube()                             cube of every row
+#   backend.select_cube(cube, age_ranges, filters)   cube.select(age_ranges)
+#                                                    restricted to `filters`
+#   backend.values(column)                           values that occur
+#
+# PandasBackend runs them on the in-memory frame, with the bitmap index for
+# filters. DuckDBBackend runs them as SQL straight over Parquet files in
+# DuckDB's multi-threaded engine, so a worker never holds the rows. Both
+# return the same cubes, down to dtypes and row order.
+import pandas as pd
+from data_processing import (
+    AGE_LABELS, WORK_INTENSITY_LABELS, CATEGORY_ORDERS, CUBE_DIMENSIONS, CUBE_DISTRIBUTIONS,
+    AggregateCube, build_cube,
+)
+from bitmap_index import BitmapIndex, filter_key
+
+try:
+    import duckdb
+except ImportError:  # only the pandas backend is available
+    duckdb = None
+
+# Categorical orders of compact_data(); other values follow in sorted order
+ORDERED_CATEGORIES = {"age_range": AGE_LABELS, "work_intensity": WORK_INTENSITY_LABELS}
+
+
+class PandasBackend(BitmapIndex):
+    name = "pandas"
+
+    def build_cube(self):
+        return build_cube(self.data, self.weight)
+
+
+class DuckDBBackend:
+    # `source`: a Parquet file, a glob, or a directory of them such as the
+    # age_range-partitioned dataset of stream_ingest()
+    name = "duckdb"
+
+    def __init__(self, source, threads=None):
+        if duckdb is None:
+            raise RuntimeError("The duckdb backend needs the duckdb package (pip install duckdb)")
+        if not source.endswith(".parquet") and "*" not in source:
+            source = source.rstrip("/") + "/**/*.parquet"
+        self.source = source
+        self._con = duckdb.connect()
+        if threads:
+            self._con.execute(f"SET threads = {int(threads)}")
+        self._con.execute(
+            "CREATE VIEW census AS SELECT * FROM read_parquet("
+            f"{_literal(source)}, hive_partitioning = true, union_by_name = true)"
+        )
+
+        # Dtypes the pandas pipeline gives these columns, so results match it
+        self.dtypes = {}
+        for column in {*CUBE_DIMENSIONS, *(key for keys in CUBE_DISTRIBUTIONS.values() for key in keys)}:
+            present = [value for (value,) in self._execute(f"SELECT DISTINCT {_ident(column)} FROM census").fetchall()
+                       if value is not None]
+            if column in ORDERED_CATEGORIES:
+                self.dtypes[column] = pd.CategoricalDtype(ORDERED_CATEGORIES[column], ordered=True)
+            else:
+                order = CATEGORY_ORDERS.get(column, [])
+                self.dtypes[column] = pd.CategoricalDtype([*order, *sorted(set(present) - set(order))])
+        for column in CUBE_DISTRIBUTIONS:
+            low, high = self._execute(f"SELECT min({_ident(column)}), max({_ident(column)}) FROM census").fetchone()
+            self.dtypes[column] = pd.to_numeric(pd.Series([low, high]), downcast="integer").dtype
+
+    def _execute(self, sql, params=()):
+        # One cursor per query, so request threads can query concurrently
+        return self._con.cursor().execute(sql, list(params))
+
+    def _frame(self, sql, params, columns):
+        # Query result with the pandas pipeline's dtypes, sorted as
+        # groupby(sort=True) sorts
+        frame = self._execute(sql, params).df()
+        for column in columns:
+            frame[column] = frame[column].astype(self.dtypes[column])
+        return frame.sort_values(columns).reset_index(drop=True)
+
+    def _where(self, selections):
+        # WHERE clause and parameters for {column: values}
+        clauses, params = [], []
+        for column, values in selections.items():
+            if values is None:
+                continue
+            values = list(values)
+            if not values:
+                clauses.append("false")
+                continue
+            clauses.append(f"{_ident(column)} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def counts(self, selections=None):
+        where, params = self._where(selections or {})
+        dimensions = ", ".join(_ident(column) for column in CUBE_DIMENSIONS)
+        return self._frame(
+            f"SELECT {dimensions}, count(*) AS count, sum(income_numeric)::BIGINT AS high_earners, "
+            f"sum(age)::BIGINT AS age_sum, sum(\"hours.per.week\")::BIGINT AS hours_sum "
+            f"FROM census{where} GROUP BY ALL",
+            params, CUBE_DIMENSIONS,
+        )
+
+    def distributions(self, selections=None):
+        where, params = self._where(selections or {})
+        distributions = {}
+        for column, keys in CUBE_DISTRIBUTIONS.items():
+            columns = ["age_range", *keys, column]
+            distributions[column] = self._frame(
+                f"SELECT {', '.join(_ident(c) for c in columns)}, count(*) AS count "
+                f"FROM census{where} GROUP BY ALL",
+                params, columns,
+            )
+        return distributions
+
+    def build_cube(self):
+        return AggregateCube(self.counts(), self.distributions())
+
+    def select_cube(self, cube, age_ranges, filters=None):
+        key = filter_key(filters)
+        if not key:
+            return cube.select(age_ranges)
+        counts = cube.counts[cube.matching(age_ranges, dict(key))]
+        return AggregateCube(counts, self.distributions({"age_range": age_ranges, **dict(key)}))
+
+    def values(self, column):
+        present = {value for (value,) in self._execute(f"SELECT DISTINCT {_ident(column)} FROM census").fetchall()}
+        return [value for value in self.dtypes[column].categories if value in present]
+
+
+def _ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(text):
+    return "'" + text.replace("'", "''") + "'"
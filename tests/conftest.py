@@ -0,0 +1,21 @@
+import os
+import sys
+import pytest
+
+# The modules live at the repository root, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import make_synthetic_census  # noqa: E402
+import data_processing as dp  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def raw_census():
+    # Small extract with the Kaggle CSV's schema ('?' placeholders included)
+    return make_synthetic_census(5_000, seed=7)
+
+
+@pytest.fixture(scope="session")
+def census(raw_census):
+    # The frame the dashboard serves
+    return dp.compact_data(dp.clean_data(raw_census))
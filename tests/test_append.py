@@ -0,0 +1,29 @@
+from pandas.testing import assert_frame_equal
+
+import data_processing as dp
+from dataset_store import DatasetStore
+
+
+def assert_cube_equal(left, right):
+    assert_frame_equal(left.counts, right.counts, check_exact=True)
+    for column in dp.CUBE_DISTRIBUTIONS:
+        assert_frame_equal(left.distributions[column], right.distributions[column], check_exact=True)
+
+
+def test_append_records_publishes_the_cube(raw_census, tmp_path):
+    csv_path, batch_path = str(tmp_path / "census.csv"), str(tmp_path / "batch.csv")
+    snapshot_path = str(tmp_path / "census.feather")
+    raw_census.iloc[:4_000].to_csv(csv_path, index=False)
+    raw_census.iloc[4_000:].to_csv(batch_path, index=False)
+
+    store = DatasetStore(csv_path=csv_path, snapshot_path=snapshot_path)
+    store.load()
+    stamp = dp.append_records(batch_path, snapshot_path)
+
+    cube = dp.read_cube(snapshot_path, stamp["version"])
+    assert cube is not None
+    assert_cube_equal(cube, dp.build_cube(dp.map_snapshot(snapshot_path)))
+
+    assert store.refresh()
+    assert store.current.version == stamp["version"]
+    assert_cube_equal(store.current.cube, cube)
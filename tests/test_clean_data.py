@@ -0,0 +1,108 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import data_processing as dp
+
+
+def reference_clean_data(df):
+    # The original row-by-row pipeline, kept to check clean_data() against
+    df = df.replace("?", "Unknown")
+    data = df.copy()
+
+    def group_education(level):
+        if level in ['Preschool','1st-4th','5th-6th','7th-8th','9th','10th','11th','12th']:
+            return 'Pre-Secondary'
+        elif level == 'HS-grad':
+            return 'Secondary-Grad'
+        elif level in ['Some-college','Assoc-acdm','Assoc-voc']:
+            return 'Higher-Ed'
+        elif level == 'Bachelors':
+            return 'Bachelors'
+        elif level in ['Masters','Prof-school','Doctorate']:
+            return 'Post-Grad'
+        return 'Other'
+
+    data["education_level"] = data["education"].apply(group_education)
+    data["age_range"] = pd.cut(data["age"], bins=[16, 25, 45, 65, 90],
+                               labels=["Young", "Adult", "Middle-Aged", "Senior"])
+    data["work_intensity"] = pd.cut(data["hours.per.week"], bins=[0,35,45,100],
+                                    labels=["Part-Time","Full-Time","Over-Time"])
+    data["native"] = data["native.country"].apply(lambda x: "US" if x == "United-States" else "Non-US")
+    data["marital_status"] = data["marital.status"].replace({
+        "Married-civ-spouse":"Married",
+        "Married-AF-spouse":"Married",
+        "Divorced":"Previously-Married",
+        "Separated":"Previously-Married",
+        "Widowed":"Previously-Married",
+        "Married-spouse-absent":"Previously-Married",
+        "Never-married":"Single"
+    })
+
+    def group_occupation(occ):
+        if occ in ['Exec-managerial','Prof-specialty']:
+            return 'White-Collar'
+        elif occ in ['Craft-repair','Farming-fishing','Machine-op-inspct','Transport-moving','Handlers-cleaners']:
+            return 'Blue-Collar'
+        elif occ in ['Sales','Tech-support','Protective-serv','Priv-house-serv','Other-service']:
+            return 'Service'
+        return 'Unknown'
+
+    data["occupation_grouped"] = data["occupation"].apply(group_occupation)
+    data["relationship_group"] = data["relationship"].replace({
+        "Husband": "In-Relationship",
+        "Wife": "In-Relationship",
+        "Own-child": "Family",
+        "Not-in-family": "Independent",
+        "Other-relative": "Family",
+        "Unmarried": "Independent"
+    })
+    data["income_numeric"] = data["income"].apply(lambda x: 1 if x == ">50K" else 0)
+    data["race"] = data["race"].replace({
+        "Amer-Indian-Eskimo": "Other",
+        "Asian-Pac-Islander": "Asian"
+    })
+    return data
+
+
+def _through_csv(frame):
+    # Dtypes as read_csv() gives them to get_cleaned_data()
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False)
+    buffer.seek(0)
+    return pd.read_csv(buffer)
+
+
+@pytest.fixture
+def raw_with_missing(raw_census):
+    raw = raw_census.head(500).copy()
+    rng = np.random.default_rng(3)
+    for column in ["workclass", "education", "marital.status", "occupation", "relationship",
+                   "race", "sex", "native.country", "income"]:
+        rows = rng.choice(len(raw), size=20, replace=False)
+        raw.loc[rows[:10], column] = "?"
+        raw.loc[rows[10:], column] = np.nan
+    return _through_csv(raw)
+
+
+def test_clean_data_matches_reference(raw_census):
+    raw = _through_csv(raw_census.head(2_000))
+    assert_frame_equal(dp.clean_data(raw), reference_clean_data(raw), check_exact=True)
+
+
+def test_clean_data_matches_reference_with_missing_values(raw_with_missing):
+    assert raw_with_missing.isna().any().any()
+    assert (raw_with_missing == "?").any().any()
+    assert_frame_equal(dp.clean_data(raw_with_missing), reference_clean_data(raw_with_missing), check_exact=True)
+
+
+@pytest.mark.parametrize("column", ["workclass", "education", "marital.status", "occupation", "race", "native.country"])
+def test_clean_data_matches_reference_with_empty_column(raw_census, column):
+    # read_csv() gives a column with no values at all float64 dtype
+    raw = raw_census.head(2).copy()
+    raw[column] = None
+    raw = _through_csv(raw)
+    assert raw[column].dtype == "float64"
+    assert_frame_equal(dp.clean_data(raw), reference_clean_data(raw), check_exact=True)
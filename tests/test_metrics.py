@@ -0,0 +1,37 @@
+import json
+import os
+import subprocess
+import sys
+
+import metrics
+
+
+def test_metrics_dir_adds_up_processes(tmp_path):
+    # A process that has exited: its histograms and counters still count,
+    # its gauges do not
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                            capture_output=True, text=True, check=True)
+    pid = int(exited.stdout)
+    (tmp_path / f"{pid}.json").write_text(json.dumps({
+        "pid": pid,
+        "histograms": [["dashboard_request_seconds", [["route", "/x"]], [0] * 8 + [2] * 5, 0.6, 2]],
+        "samples": [["test_jobs_total", "counter", "Jobs.", [], 3],
+                    ["test_entries", "gauge", "Entries.", [], 4]],
+    }))
+
+    metrics.register_collector(lambda: [("test_jobs_total", "counter", "Jobs.", {}, 1),
+                                        ("test_entries", "gauge", "Entries.", {}, 5)])
+    try:
+        metrics.observe("dashboard_request_seconds", 0.3, route="/x")
+        text = metrics.render_prometheus(str(tmp_path))
+    finally:
+        metrics._collectors.pop()
+        metrics._histograms.clear()
+
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+    lines = text.splitlines()
+    assert 'dashboard_request_seconds_count{route="/x"} 3' in lines
+    assert 'dashboard_request_seconds_bucket{route="/x",le="0.25"} 0' in lines
+    assert 'dashboard_request_seconds_bucket{route="/x",le="0.5"} 3' in lines
+    assert "test_jobs_total 4" in lines
+    assert "test_entries 5" in lines
@@ -0,0 +1,49 @@
+import pytest
+from pandas.testing import assert_frame_equal
+
+pytest.importorskip("duckdb")
+
+from data_processing import AGE_LABELS, CUBE_DISTRIBUTIONS  # noqa: E402
+from bitmap_index import FILTER_COLUMNS  # noqa: E402
+from query_backend import PandasBackend, DuckDBBackend  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def backends(census, tmp_path_factory):
+    path = tmp_path_factory.mktemp("parquet") / "census.parquet"
+    census.to_parquet(path, index=False)
+    return PandasBackend(census), DuckDBBackend(str(path))
+
+
+def assert_cube_equal(left, right):
+    assert_frame_equal(left.counts, right.counts)
+    assert left.distributions.keys() == right.distributions.keys() == CUBE_DISTRIBUTIONS.keys()
+    for column in CUBE_DISTRIBUTIONS:
+        assert_frame_equal(left.distributions[column], right.distributions[column])
+
+
+def test_build_cube(backends):
+    pandas_backend, duckdb_backend = backends
+    assert_cube_equal(pandas_backend.build_cube(), duckdb_backend.build_cube())
+
+
+@pytest.mark.parametrize("age_ranges, filters", [
+    (AGE_LABELS, None),
+    (["Adult", "Senior"], {"sex": ["Female"]}),
+    (["Young", "Adult", "Middle-Aged"], {"race": ["White", "Black"], "native": ["US"]}),
+    (AGE_LABELS, {"workclass": ["Unknown"], "education_level": ["Bachelors", "Post-Grad"]}),
+    (["Middle-Aged"], {"sex": []}),
+])
+def test_select_cube(backends, age_ranges, filters):
+    pandas_backend, duckdb_backend = backends
+    cube = pandas_backend.build_cube()
+    assert_cube_equal(
+        pandas_backend.select_cube(cube, age_ranges, filters),
+        duckdb_backend.select_cube(cube, age_ranges, filters),
+    )
+
+
+@pytest.mark.parametrize("column", FILTER_COLUMNS)
+def test_values(backends, column):
+    pandas_backend, duckdb_backend = backends
+    assert pandas_backend.values(column) == duckdb_backend.values(column)
@@ -0,0 +1,24 @@
+import pytest
+from pandas.testing import assert_frame_equal
+
+import data_processing as dp
+from dashboard_layouts import Aggregates
+
+
+@pytest.mark.parametrize("fraction", [0.08, 0.15, 0.3])
+def test_sample_keeps_strata_totals(census, fraction):
+    # The weights of a stratum sum to its size, and summing the cube cells
+    # must not drift from that
+    sample = dp.stratified_sample(census, fraction)
+    exact = dp.build_cube(census).counts.groupby(dp.SAMPLE_STRATA, observed=True)[["count", "high_earners"]].sum()
+    approx = dp.build_cube(sample, weight="weight").counts.groupby(dp.SAMPLE_STRATA, observed=True)[["count", "high_earners"]].sum()
+    assert_frame_equal(approx, exact.astype("float64"), rtol=1e-9)
+
+
+def test_sample_rollup_rounds_after_summing(census):
+    sample = dp.stratified_sample(census, 0.1)
+    exact = Aggregates(dp.build_cube(census), []).rollup(["age_range"])
+    approx = Aggregates(dp.build_cube(sample, weight="weight"), []).rollup(["age_range"])
+    assert approx["count"].dtype == "int64"
+    assert approx["count"].tolist() == exact["count"].tolist()
+    assert approx["high_earners"].tolist() == exact["high_earners"].tolist()
@@ -0,0 +1,41 @@
+import pytest
+from pandas.testing import assert_frame_equal
+
+import data_processing as dp
+
+
+@pytest.fixture(scope="module")
+def ingested(raw_census, tmp_path_factory):
+    # A few hundred rows per batch, so several batches land in every partition
+    root = tmp_path_factory.mktemp("stream")
+    csv_path = str(root / "census.csv")
+    # Ages outside AGE_BINS have no age_range
+    raw = raw_census.copy()
+    raw.loc[::97, "age"] = 16
+    raw.loc[50::101, "age"] = 95
+    raw.to_csv(csv_path, index=False)
+    out_dir = str(root / "dataset")
+    cube = dp.stream_ingest(csv_path, out_dir, chunksize=700)
+    return csv_path, out_dir, cube
+
+
+def test_read_partitioned_matches_get_cleaned_data(ingested):
+    csv_path, out_dir, _ = ingested
+    assert dp.get_cleaned_data(csv_path)["age_range"].isna().any()
+    assert_frame_equal(dp.read_partitioned(out_dir), dp.get_cleaned_data(csv_path), check_exact=True)
+
+
+def test_read_partitioned_age_ranges(ingested):
+    csv_path, out_dir, _ = ingested
+    expected = dp.get_cleaned_data(csv_path)
+    expected = expected[expected["age_range"].isin(["Young", "Senior"])].reset_index(drop=True)
+    assert_frame_equal(dp.read_partitioned(out_dir, ["Young", "Senior"]), expected, check_exact=True)
+
+
+def test_streamed_cube_matches_build_cube(ingested):
+    csv_path, _, cube = ingested
+    expected = dp.build_cube(dp.get_cleaned_data(csv_path))
+    assert_frame_equal(cube.counts, expected.counts, check_exact=True)
+    assert cube.distributions.keys() == expected.distributions.keys()
+    for column in dp.CUBE_DISTRIBUTIONS:
+        assert_frame_equal(cube.distributions[column], expected.distributions[column], check_exact=True)